@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared API Plumbing
+Upload guards, PDF saving, DOCX streaming and workspace location for both FastAPI apps
+"""
+
+import hashlib
+import os
+import aiofiles
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse
+
+# Workspaces on tmpfs when available - every PDF write and DOCX save stays in RAM
+WORKSPACE_ROOT = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+
+# Upload guards - the five tender PDFs together are a few MB
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+_PDF_CONTENT_TYPES = ("application/pdf", "application/octet-stream")
+_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+async def limit_upload_size(request: Request, call_next):
+    """HTTP middleware: refuse oversized uploads from the Content-Length header before the multipart parser reads them
+    (chunked bodies have no header - save_pdf_upload counts those bytes itself)"""
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload too large: {int(content_length):,} bytes (limit {MAX_UPLOAD_BYTES:,})"}
+        )
+    return await call_next(request)
+
+class DocxFileResponse(FileResponse):
+    """FileResponse streaming the DOCX in 1 MiB async reads instead of 64 KiB"""
+    chunk_size = 1024 * 1024
+
+async def save_pdf_upload(pdf_file, file_path, received=0):
+    """
+    Stream one uploaded PDF to file_path in 1 MiB chunks without blocking the event loop
+    received: bytes already saved from this request; returns (new running total, SHA-256 hex digest)
+    """
+    digest = hashlib.sha256()
+    # Check the declared type and the %PDF- magic on the first chunk before anything is written
+    chunk = await pdf_file.read(_UPLOAD_CHUNK_BYTES)
+    if pdf_file.content_type not in _PDF_CONTENT_TYPES or not chunk.startswith(b"%PDF-"):
+        raise HTTPException(status_code=415, detail=f"Not a PDF file: {pdf_file.filename}")
+    async with aiofiles.open(file_path, "wb") as f:
+        while chunk:
+            received += len(chunk)
+            if received > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Upload too large (limit {MAX_UPLOAD_BYTES:,} bytes)")
+            digest.update(chunk)
+            await f.write(chunk)
+            chunk = await pdf_file.read(_UPLOAD_CHUNK_BYTES)
+    return received, digest.hexdigest()
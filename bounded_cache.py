@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared Bounded Cache
+Small in-memory LRU used by both APIs for exact-match results
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+class BoundedCache:
+    """LRU of at most max_entries values - pass thread_safe=True when worker threads share it"""
+
+    def __init__(self, max_entries, thread_safe=False):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock() if thread_safe else nullcontext()
+
+    def get(self, key):
+        """Cached value or None - a hit becomes the most recently used entry"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store a value, dropping the least recently used entry past max_entries"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
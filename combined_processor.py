@@ -7,17 +7,24 @@ Combined Processor: Step Detection + Document Replacement
 """
 
 import os
+import re
 import shutil
-import fitz  # PyMuPDF
+import zipfile
+from pathlib import Path
 import openai
 from docx import Document
 from docx.oxml import parse_xml
 from copy import deepcopy
 from dotenv import load_dotenv
+from openai_session import use_shared_openai_session
+from pdf_text import extract_pages_text
 
 # Load environment variables
 load_dotenv()
 
+# Strips run/paragraph tags so a placeholder split across w:r runs still matches
+_XML_TAG_RE = re.compile(rb'<[^>]*>')
+
 class CombinedProcessor:
     def __init__(self):
         """Initialize the combined processor"""
@@ -26,11 +33,13 @@ class CombinedProcessor:
             raise ValueError("❌ OPENAI_API_KEY not found in .env file!")
         
         openai.api_key = self.openai_api_key
+        use_shared_openai_session()
         
         # File paths
         self.template_file = "02_MUC_DO_HIEU_BIET_template.docx"
         self.output_file = "02_MUC_DO_HIEU_BIET_output.docx"
         self.chuong_v_pdf = "CHUONG_V.pdf"
+        self.buoc_folder = Path(".")  # where 21_BUOC.docx / 23_BUOC.docx live
         
         print("✅ CombinedProcessor initialized")
 
@@ -41,19 +50,10 @@ class CombinedProcessor:
         try:
             print(f"📖 Extracting text from: {pdf_path}")
             
-            doc = fitz.open(pdf_path)
-            text = ""
-            page_count = len(doc)
-            
-            for page_num in range(page_count):
-                page = doc.load_page(page_num)
-                page_text = page.get_text()
-                text += f"\n--- PAGE {page_num + 1} ---\n"
-                text += page_text
+            # Page-marked text; large PDFs fan out over the shared pdf_text worker pool
+            text = extract_pages_text(pdf_path)
             
-            doc.close()
-            
-            print(f"✅ Extracted {len(text)} characters from {page_count} pages")
+            print(f"✅ Extracted {len(text)} characters")
             return text
             
         except Exception as e:
@@ -123,95 +123,113 @@ STEP COUNT:"""
 
     # ============ DOCUMENT REPLACEMENT METHODS ============
     
+    def insert_content(self, doc, content_path, placeholder="{{cac_buoc_thuc_hien}}"):
+        """Replace the placeholder in an already-open Document with content from another DOCX file"""
+        source_doc = Document(content_path)
+        
+        # Get all content from source
+        all_elements = []
+        
+        for para in source_doc.paragraphs:
+            if para.text.strip():
+                all_elements.append(('paragraph', para))
+        
+        for table in source_doc.tables:
+            all_elements.append(('table', table))
+        
+        print(f"📊 Total elements to copy: {len(all_elements)}")
+        
+        # Find and replace placeholder
+        placeholder_found = False
+        
+        for i, paragraph in enumerate(doc.paragraphs):
+            if placeholder in paragraph.text:
+                print(f"📍 Found placeholder in paragraph {i}")
+                placeholder_found = True
+                
+                # Use proven replacement method
+                p_element = paragraph._element
+                parent = p_element.getparent()
+                index = parent.index(p_element)
+                parent.remove(p_element)
+                
+                # Insert all elements with formatting enhancements
+                for element_type, element in reversed(all_elements):
+                    if element_type == 'paragraph':
+                        new_p = deepcopy(element._element)
+                        
+                        # ENHANCE PARAGRAPH SPACING
+                        pPr = new_p.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}pPr')
+                        if pPr is None:
+                            pPr = parse_xml('<w:pPr xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>')
+                            new_p.insert(0, pPr)
+                        
+                        spacing_xml = '''<w:spacing xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" 
+                                        w:before="120" w:after="120" w:line="360" w:lineRule="auto"/>'''
+                        spacing = parse_xml(spacing_xml)
+                        
+                        existing_spacing = pPr.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}spacing')
+                        if existing_spacing is not None:
+                            pPr.remove(existing_spacing)
+                        pPr.append(spacing)
+                        
+                        parent.insert(index, new_p)
+                        
+                    elif element_type == 'table':
+                        new_t = deepcopy(element._element)
+                        
+                        # ENHANCE TABLE ROW HEIGHT
+                        rows = new_t.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}tr')
+                        for row in rows:
+                            trPr = row.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}trPr')
+                            if trPr is None:
+                                trPr = parse_xml('<w:trPr xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>')
+                                row.insert(0, trPr)
+                            
+                            height_xml = '''<w:trHeight xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" 
+                                           w:val="600" w:hRule="atLeast"/>'''
+                            height = parse_xml(height_xml)
+                            
+                            existing_height = trPr.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}trHeight')
+                            if existing_height is not None:
+                                trPr.remove(existing_height)
+                            trPr.append(height)
+                        
+                        parent.insert(index, new_t)
+                
+                break
+        
+        if not placeholder_found:
+            print(f"❌ Placeholder '{placeholder}' not found!")
+            return False
+        
+        return True
+
+    def body_contains_placeholder(self, docx_path, placeholder):
+        """Cheap pre-check on word/document.xml text (body only - headers/footers are not scanned)"""
+        with zipfile.ZipFile(docx_path) as z:
+            xml = z.read('word/document.xml')
+        return placeholder.encode('utf-8') in _XML_TAG_RE.sub(b'', xml)
+
     def replace_placeholder_only(self, template_path, content_path, output_path, placeholder="{{cac_buoc_thuc_hien}}"):
         """Replace ONLY the placeholder with content from another DOCX file"""
         try:
             print(f"🔄 Replacing placeholder with content from: {content_path}")
             
+            # Fail fast on a raw zip read before copying and parsing the whole docx
+            if not self.body_contains_placeholder(template_path, placeholder):
+                print(f"❌ Placeholder '{placeholder}' not found!")
+                return False
+            
             # Step 1: Copy template to output
             shutil.copy2(template_path, output_path)
             
-            # Step 2: Load documents
+            # Step 2: Load document and insert content
             doc = Document(output_path)
-            source_doc = Document(content_path)
-            
-            # Step 3: Get all content from source
-            all_elements = []
-            
-            for para in source_doc.paragraphs:
-                if para.text.strip():
-                    all_elements.append(('paragraph', para))
-            
-            for table in source_doc.tables:
-                all_elements.append(('table', table))
-            
-            print(f"📊 Total elements to copy: {len(all_elements)}")
-            
-            # Step 4: Find and replace placeholder
-            placeholder_found = False
-            
-            for i, paragraph in enumerate(doc.paragraphs):
-                if placeholder in paragraph.text:
-                    print(f"📍 Found placeholder in paragraph {i}")
-                    placeholder_found = True
-                    
-                    # Use proven replacement method
-                    p_element = paragraph._element
-                    parent = p_element.getparent()
-                    index = parent.index(p_element)
-                    parent.remove(p_element)
-                    
-                    # Insert all elements with formatting enhancements
-                    for element_type, element in reversed(all_elements):
-                        if element_type == 'paragraph':
-                            new_p = deepcopy(element._element)
-                            
-                            # ENHANCE PARAGRAPH SPACING
-                            pPr = new_p.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}pPr')
-                            if pPr is None:
-                                pPr = parse_xml('<w:pPr xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>')
-                                new_p.insert(0, pPr)
-                            
-                            spacing_xml = '''<w:spacing xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" 
-                                            w:before="120" w:after="120" w:line="360" w:lineRule="auto"/>'''
-                            spacing = parse_xml(spacing_xml)
-                            
-                            existing_spacing = pPr.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}spacing')
-                            if existing_spacing is not None:
-                                pPr.remove(existing_spacing)
-                            pPr.append(spacing)
-                            
-                            parent.insert(index, new_p)
-                            
-                        elif element_type == 'table':
-                            new_t = deepcopy(element._element)
-                            
-                            # ENHANCE TABLE ROW HEIGHT
-                            rows = new_t.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}tr')
-                            for row in rows:
-                                trPr = row.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}trPr')
-                                if trPr is None:
-                                    trPr = parse_xml('<w:trPr xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>')
-                                    row.insert(0, trPr)
-                                
-                                height_xml = '''<w:trHeight xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" 
-                                               w:val="600" w:hRule="atLeast"/>'''
-                                height = parse_xml(height_xml)
-                                
-                                existing_height = trPr.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}trHeight')
-                                if existing_height is not None:
-                                    trPr.remove(existing_height)
-                                trPr.append(height)
-                            
-                            parent.insert(index, new_t)
-                    
-                    break
-            
-            if not placeholder_found:
-                print(f"❌ Placeholder '{placeholder}' not found!")
+            if not self.insert_content(doc, content_path, placeholder):
                 return False
             
-            # Step 5: Save document
+            # Step 3: Save document
             doc.save(output_path)
             print(f"✅ Document saved: {output_path}")
             return True
@@ -222,20 +240,19 @@ STEP COUNT:"""
 
     # ============ COMBINED PROCESS ============
     
-    def process_complete_workflow(self):
-        """Complete workflow: detect steps + replace content"""
-        print("\n🚀 STARTING COMPLETE WORKFLOW")
-        print("=" * 60)
-        
+    def extract_content(self, required_files=None):
+        """Steps 1-3: detect 21 vs 23 steps from CHUONG_V.pdf - returns the content file or None"""
         # Check required files
-        required_files = [self.template_file, self.chuong_v_pdf, "21_BUOC.docx", "23_BUOC.docx"]
+        required_files = (required_files or []) + [
+            self.chuong_v_pdf, self.buoc_folder / "21_BUOC.docx", self.buoc_folder / "23_BUOC.docx"
+        ]
         missing_files = [f for f in required_files if not os.path.exists(f)]
         
         if missing_files:
             print("❌ Missing required files:")
             for f in missing_files:
                 print(f"  - {f}")
-            return False
+            return None
         
         # Step 1: Extract PDF text
         print("\n📖 STEP 1: Extracting text from CHUONG_V.pdf...")
@@ -243,7 +260,7 @@ STEP COUNT:"""
         
         if not pdf_text:
             print("❌ Failed to extract PDF text")
-            return False
+            return None
         
         # Step 2: Detect step count
         print("\n🤖 STEP 2: Detecting step count with OpenAI...")
@@ -251,16 +268,37 @@ STEP COUNT:"""
         
         if not step_count:
             print("❌ Failed to detect step count")
-            return False
+            return None
         
         print(f"✅ Detected: {step_count} steps")
         
         # Step 3: Select appropriate content file
-        content_file = f"{step_count}_BUOC.docx"
+        content_file = str(self.buoc_folder / f"{step_count}_BUOC.docx")
         print(f"\n📄 STEP 3: Selected content file: {content_file}")
+        return content_file
+
+    def process_document(self, doc):
+        """Apply {{cac_buoc_thuc_hien}} to an already-open Document in place - returns doc, or None on failure"""
+        content_file = self.extract_content()
+        if not content_file:
+            return None
+        
+        print(f"\n🔄 STEP 4: Replacing placeholder with {content_file} content...")
+        if not self.insert_content(doc, content_file):
+            return None
+        return doc
+
+    def process_complete_workflow(self):
+        """Complete workflow: detect steps + replace content"""
+        print("\n🚀 STARTING COMPLETE WORKFLOW")
+        print("=" * 60)
+        
+        content_file = self.extract_content(required_files=[self.template_file])
+        if not content_file:
+            return False
         
         # Step 4: Replace placeholder
-        print(f"\n🔄 STEP 4: Replacing placeholder with {step_count}-step content...")
+        print(f"\n🔄 STEP 4: Replacing placeholder with {content_file} content...")
         success = self.replace_placeholder_only(
             self.template_file, 
             content_file, 
@@ -270,7 +308,7 @@ STEP COUNT:"""
         if success:
             print(f"\n🎉 SUCCESS! Complete workflow finished!")
             print(f"📄 Output file: {self.output_file}")
-            print(f"🔢 Used {step_count}-step process")
+            print(f"🔢 Used {content_file}")
             print("=" * 60)
             return True
         else:
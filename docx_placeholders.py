@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared DOCX Placeholder Lookup
+Finds the body paragraphs holding a {{placeholder}} tag for every processor
+"""
+
+from lxml import etree
+
+# Find placeholder paragraphs via XPath (scanned in C by lxml) - compiled once, with the tag passed
+# as a variable so quotes in it cannot break the expression; body-level only, never inside a table cell
+_PLACEHOLDER_PARAGRAPHS_XP = etree.XPath(
+    "./w:p[contains(string(.), $ph)]",
+    namespaces={'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+)
+
+def find_placeholder_paragraphs(body, placeholder_tag):
+    """<w:p> children of body whose text contains placeholder_tag, in document order"""
+    return _PLACEHOLDER_PARAGRAPHS_XP(body, ph=placeholder_tag)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared OpenAI HTTP Session
+One pooled keep-alive session reused by every processor (and every thread)
+"""
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from openai.api_requestor import MAX_CONNECTION_RETRIES
+
+class SharedSession(requests.Session):
+    """Session that outlives openai's per-thread refresh - openai.api_requestor closes its
+    session every MAX_SESSION_LIFETIME_SECS, which would drop connections other threads are using"""
+
+    def close(self):
+        pass
+
+# Module-level singleton - created once per process
+OPENAI_SESSION = SharedSession()
+OPENAI_SESSION.mount(
+    "https://",
+    HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=MAX_CONNECTION_RETRIES)
+)
+
+def use_shared_openai_session():
+    """Point the legacy openai module at the shared pooled session"""
+    openai.requestssession = OPENAI_SESSION
+    return OPENAI_SESSION
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared PDF Text Extraction
+PyMuPDF-based reader used by every processor, cached per (path, mtime)
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import fitz  # PyMuPDF
+
+# fitz keeps global state and is not thread-safe - one extraction at a time per process
+FITZ_LOCK = threading.Lock()
+
+# Below this many pages per worker, process startup costs more than it saves
+MIN_PAGES_PER_WORKER = 8
+
+# One long-lived worker pool per process, created on first use
+# spawn, not fork: the pool may be (re)built from a server that already runs threads
+_PDF_POOL_WORKERS = min(4, os.cpu_count() or 1)
+_PDF_POOL_LOCK = threading.Lock()
+_pdf_pool = None
+
+def get_pdf_pool():
+    """The shared PDF worker pool - parallel fitz work needs processes, not threads"""
+    global _pdf_pool
+    with _PDF_POOL_LOCK:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=_PDF_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pool
+
+def reset_pdf_pool(broken_pool):
+    """Drop a pool whose worker died (BrokenProcessPool) - the next get_pdf_pool() builds a fresh one"""
+    global _pdf_pool
+    with _PDF_POOL_LOCK:
+        if _pdf_pool is broken_pool:
+            _pdf_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+def run_pdf_jobs(jobs):
+    """
+    Run (fn, *args) jobs on the shared pool and return their results in order
+    A worker that dies (MuPDF crash, OOM kill) breaks the pool - rebuild it and retry the batch once
+    """
+    for attempt in (1, 2):
+        pool = get_pdf_pool()
+        try:
+            futures = [pool.submit(*job) for job in jobs]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            reset_pdf_pool(pool)
+            print(f"⚠️ PDF worker pool broken (attempt {attempt}) - rebuilt")
+    raise Exception("PDF parsing worker crashed twice on the same batch")
+
+def extract_pdf_text(pdf_path):
+    """Extract all pages with no lock or cache - for a worker process that has fitz to itself"""
+    with fitz.open(str(pdf_path)) as doc:
+        return "\n".join(page.get_text("text") for page in doc)
+
+def extract_page_range(pdf_path, start=0, stop=None):
+    """Pages [start, stop) with '--- PAGE n ---' markers (stop=None: to the end) - no lock, for a process with its own fitz.Document"""
+    fitz.TOOLS.mupdf_display_errors(False)
+    with fitz.open(str(pdf_path)) as doc:
+        parts = []
+        for page_num in range(start, len(doc) if stop is None else stop):
+            parts.append(f"\n--- PAGE {page_num + 1} ---\n")
+            parts.append(doc.load_page(page_num).get_text())
+    return "".join(parts)
+
+def extract_text_and_pages(pdf_path):
+    """One parse, both forms: (extract_pdf_text output, extract_page_range output) - no lock, for a worker process"""
+    fitz.TOOLS.mupdf_display_errors(False)
+    with fitz.open(str(pdf_path)) as doc:
+        pages = [page.get_text("text") for page in doc]
+    marked = "".join(f"\n--- PAGE {page_num} ---\n{text}" for page_num, text in enumerate(pages, 1))
+    return "\n".join(pages), marked
+
+def extract_pages_text(pdf_path):
+    """Page-marked text of a whole PDF; large files are split into page ranges across the shared pool"""
+    pdf_path = str(pdf_path)
+    with FITZ_LOCK:
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+
+    workers = min(_PDF_POOL_WORKERS, page_count // MIN_PAGES_PER_WORKER)
+    if workers > 1:
+        step = -(-page_count // workers)
+        starts = range(0, page_count, step)
+        return "".join(run_pdf_jobs(
+            [(extract_page_range, pdf_path, start, min(start + step, page_count)) for start in starts]
+        ))
+
+    # Small file - in this process, sharing the lock with read_pdf_text callers on other threads
+    with FITZ_LOCK:
+        return extract_page_range(pdf_path, 0, page_count)
+
+@lru_cache(maxsize=16)
+def _read_pdf_text(abs_path, mtime_ns):
+    """Extract all pages - mtime_ns is only part of the cache key"""
+    with FITZ_LOCK:
+        return extract_pdf_text(abs_path)
+
+def read_pdf_text(pdf_path):
+    """Text of a PDF; the same unchanged file is only parsed once per process"""
+    abs_path = os.path.abspath(pdf_path)
+    return _read_pdf_text(abs_path, os.stat(abs_path).st_mtime_ns)
@@ -1,15 +1,52 @@
 import os
 import shutil
+import zipfile
 from pathlib import Path
+from xml.sax.saxutils import escape
 import openai
 from docx import Document
 from docx.shared import Pt
-import PyPDF2
 from dotenv import load_dotenv
+from openai_session import use_shared_openai_session
+from pdf_text import read_pdf_text
 
 # Load environment variables
 load_dotenv()
 
+def fast_replace_text_placeholders(template_zip_path, out_path, mapping):
+    """Replace plain-text placeholders directly in word/document.xml without python-docx
+
+    Only placeholders stored contiguously in a single run can be found this way;
+    returns the list of keys that were replaced (empty list = nothing written)
+    
+    A key is only handled here when the result matches the python-docx path exactly:
+    the tag occurs once, and the value is a single line with no tab or edge spaces
+    (python-docx writes those as <w:br/>/<w:tab/> and xml:space="preserve")
+    """
+    with zipfile.ZipFile(template_zip_path) as zin:
+        xml = zin.read('word/document.xml')
+        replaced = []
+        for key, value in mapping.items():
+            if value != value.strip() or any(ch in value for ch in "\n\r\t"):
+                continue
+            tag = f"{{{{{key}}}}}".encode('utf-8')
+            if xml.count(tag) == 1:
+                xml = xml.replace(tag, escape(value).encode('utf-8'))
+                replaced.append(key)
+
+        if not replaced:
+            return replaced
+
+        # Write next to the target first so template and output may be the same file
+        tmp_path = f"{out_path}.tmp"
+        with zipfile.ZipFile(tmp_path, 'w') as zout:
+            for item in zin.infolist():
+                data = xml if item.filename == 'word/document.xml' else zin.read(item.filename)
+                zout.writestr(item, data)
+
+    os.replace(tmp_path, out_path)
+    return replaced
+
 class VietnameseProcurementProcessor:
     def __init__(self):
         """Initialize the processor with OpenAI API key from .env"""
@@ -18,6 +55,7 @@ class VietnameseProcurementProcessor:
             raise ValueError("❌ OPENAI_API_KEY not found in .env file!")
         
         openai.api_key = self.openai_api_key
+        use_shared_openai_session()
         self.pdf_folder = Path("pdf_inputs")
         self.template_file = "02_MUC_DO_HIEU_BIET_template.docx"
         self.output_file = "02_MUC_DO_HIEU_BIET_output.docx"
@@ -43,20 +81,16 @@ class VietnameseProcurementProcessor:
             print(f"   - {pdf}")
 
     def extract_text_from_pdf(self, pdf_path):
-        """Extract text content from PDF file"""
+        """Extract text content from PDF file (PyMuPDF, cached per path + mtime)"""
         try:
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+            return read_pdf_text(pdf_path)
         except Exception as e:
             print(f"❌ Error reading {pdf_path}: {str(e)}")
             return None
 
     def ask_openai_for_ten_goi_thau(self, tbmt_content):
         """Ask OpenAI to extract 'ten_goi_thau' from TBMT.pdf content"""
+        # Fixed instructions first, TBMT text last - keeps the prompt prefix identical across calls (OpenAI prompt caching)
         prompt = f"""
 Bạn là chuyên gia phân tích tài liệu đấu thầu Việt Nam.
 
@@ -130,101 +164,106 @@ TÊN GÓI THẦU (chỉ nội dung cột phải):"""
             print(f"❌ Error copying template: {str(e)}")
             return False
 
-    def replace_placeholder_in_docx(self, placeholder, content):
-        """Replace placeholder in DOCX file while preserving exact formatting - simplified approach"""
-        try:
-            doc = Document(self.output_file)
-            replaced = False
-            
-            print(f"🔍 Looking for placeholder: '{placeholder}'")
-            print(f"🔄 Will replace with: '{content}'")
-            
-            # Simple approach: Replace in paragraphs
-            for para_idx, paragraph in enumerate(doc.paragraphs):
-                full_text = paragraph.text
-                if placeholder in full_text:
-                    print(f"📍 Found placeholder in paragraph {para_idx}")
-                    
-                    # Build the replacement character by character to preserve formatting
-                    placeholder_start = full_text.find(placeholder)
-                    placeholder_end = placeholder_start + len(placeholder)
+    def replace_placeholder_in_doc(self, doc, placeholder, content, paragraph=None):
+        """Replace placeholder in an already-open Document in place (no load/save) - paragraph: the body one holding it, if known"""
+        replaced = False
+        
+        print(f"🔍 Looking for placeholder: '{placeholder}'")
+        print(f"🔄 Will replace with: '{content}'")
+        
+        # Simple approach: Replace in paragraphs (only the located one, if the caller found it already)
+        body_paragraphs = [paragraph] if paragraph is not None else doc.paragraphs
+        for para_idx, paragraph in enumerate(body_paragraphs):
+            full_text = paragraph.text
+            if placeholder in full_text:
+                print(f"📍 Found placeholder in paragraph {para_idx}")
+                
+                # Build the replacement character by character to preserve formatting
+                placeholder_start = full_text.find(placeholder)
+                placeholder_end = placeholder_start + len(placeholder)
+                
+                # Find which runs contain the placeholder
+                char_count = 0
+                start_run_idx = -1
+                end_run_idx = -1
+                start_char_in_run = 0
+                end_char_in_run = 0
+                
+                for run_idx, run in enumerate(paragraph.runs):
+                    run_len = len(run.text)
                     
-                    # Find which runs contain the placeholder
-                    char_count = 0
-                    start_run_idx = -1
-                    end_run_idx = -1
-                    start_char_in_run = 0
-                    end_char_in_run = 0
+                    # Check if placeholder starts in this run
+                    if start_run_idx == -1 and char_count <= placeholder_start < char_count + run_len:
+                        start_run_idx = run_idx
+                        start_char_in_run = placeholder_start - char_count
                     
-                    for run_idx, run in enumerate(paragraph.runs):
-                        run_len = len(run.text)
+                    # Check if placeholder ends in this run
+                    if char_count < placeholder_end <= char_count + run_len:
+                        end_run_idx = run_idx
+                        end_char_in_run = placeholder_end - char_count
+                        break
                         
-                        # Check if placeholder starts in this run
-                        if start_run_idx == -1 and char_count <= placeholder_start < char_count + run_len:
-                            start_run_idx = run_idx
-                            start_char_in_run = placeholder_start - char_count
-                        
-                        # Check if placeholder ends in this run
-                        if char_count < placeholder_end <= char_count + run_len:
-                            end_run_idx = run_idx
-                            end_char_in_run = placeholder_end - char_count
-                            break
-                            
-                        char_count += run_len
+                    char_count += run_len
+                
+                if start_run_idx >= 0 and end_run_idx >= 0:
+                    print(f"📍 Placeholder spans from run {start_run_idx} to run {end_run_idx}")
                     
-                    if start_run_idx >= 0 and end_run_idx >= 0:
-                        print(f"📍 Placeholder spans from run {start_run_idx} to run {end_run_idx}")
+                    # Case 1: Placeholder is within a single run
+                    if start_run_idx == end_run_idx:
+                        run = paragraph.runs[start_run_idx]
+                        old_text = run.text
+                        new_text = old_text[:start_char_in_run] + content + old_text[end_char_in_run:]
+                        run.text = new_text
+                        print(f"✅ Single run replacement: '{old_text}' → '{new_text}'")
                         
-                        # Case 1: Placeholder is within a single run
-                        if start_run_idx == end_run_idx:
-                            run = paragraph.runs[start_run_idx]
-                            old_text = run.text
-                            new_text = old_text[:start_char_in_run] + content + old_text[end_char_in_run:]
-                            run.text = new_text
-                            print(f"✅ Single run replacement: '{old_text}' → '{new_text}'")
+                    # Case 2: Placeholder spans multiple runs
+                    else:
+                        # Clear placeholder from all affected runs
+                        for i in range(start_run_idx, end_run_idx + 1):
+                            run = paragraph.runs[i]
+                            if i == start_run_idx:
+                                # Keep text before placeholder
+                                run.text = run.text[:start_char_in_run]
+                            elif i == end_run_idx:
+                                # Keep text after placeholder and add content
+                                run.text = content + run.text[end_char_in_run:]
+                            else:
+                                # Clear middle runs
+                                run.text = ""
+                        print(f"✅ Multi-run replacement completed")
+                    
+                    replaced = True
+                    break  # Only replace first occurrence
+        
+        # Also check tables with same logic
+        for table in doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    for paragraph in cell.paragraphs:
+                        full_text = paragraph.text
+                        if placeholder in full_text:
+                            print(f"📍 Found placeholder in table cell")
                             
-                        # Case 2: Placeholder spans multiple runs
-                        else:
-                            # Clear placeholder from all affected runs
-                            for i in range(start_run_idx, end_run_idx + 1):
-                                run = paragraph.runs[i]
-                                if i == start_run_idx:
-                                    # Keep text before placeholder
-                                    run.text = run.text[:start_char_in_run]
-                                elif i == end_run_idx:
-                                    # Keep text after placeholder and add content
-                                    run.text = content + run.text[end_char_in_run:]
-                                else:
-                                    # Clear middle runs
-                                    run.text = ""
-                            print(f"✅ Multi-run replacement completed")
-                        
-                        replaced = True
-                        break  # Only replace first occurrence
-            
-            # Also check tables with same logic
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            full_text = paragraph.text
-                            if placeholder in full_text:
-                                print(f"📍 Found placeholder in table cell")
-                                
-                                # Simple replacement for table cells
-                                for run in paragraph.runs:
-                                    if placeholder in run.text:
-                                        run.text = run.text.replace(placeholder, content)
-                                        replaced = True
-                                        break
-            
+                            # Simple replacement for table cells
+                            for run in paragraph.runs:
+                                if placeholder in run.text:
+                                    run.text = run.text.replace(placeholder, content)
+                                    replaced = True
+                                    break
+        
+        if replaced:
+            print(f"✅ Successfully replaced {placeholder}")
+        else:
+            print(f"❌ Failed to find {placeholder}")
+        
+        return replaced
+
+    def replace_placeholder_in_docx(self, placeholder, content):
+        """Replace placeholder in DOCX file while preserving exact formatting - simplified approach"""
+        try:
+            doc = Document(self.output_file)
+            replaced = self.replace_placeholder_in_doc(doc, placeholder, content)
             doc.save(self.output_file)
-            
-            if replaced:
-                print(f"✅ Successfully replaced {placeholder}")
-            else:
-                print(f"❌ Failed to find {placeholder}")
-            
             return replaced
             
         except Exception as e:
@@ -233,23 +272,20 @@ TÊN GÓI THẦU (chỉ nội dung cột phải):"""
             traceback.print_exc()
             return False
 
-    def test_ten_goi_thau_extraction(self):
-        """Test extraction of 'ten_goi_thau' from TBMT.pdf"""
-        print("\n🧪 TESTING: {{ten_goi_thau}} extraction from TBMT.pdf")
-        print("=" * 60)
-        
+    def extract_content(self):
+        """Read TBMT.pdf and ask OpenAI for 'ten_goi_thau' - returns the text or None"""
         # Check if TBMT.pdf exists
         tbmt_file = self.pdf_folder / self.pdf_files['TBMT']
         if not tbmt_file.exists():
             print(f"❌ File not found: {tbmt_file}")
             print(f"📋 Please place TBMT.pdf in the '{self.pdf_folder}' folder")
-            return False
+            return None
         
         # Extract text from TBMT.pdf
         print("📖 Reading TBMT.pdf...")
         tbmt_content = self.extract_text_from_pdf(tbmt_file)
         if not tbmt_content:
-            return False
+            return None
         
         print(f"✅ Extracted {len(tbmt_content)} characters from TBMT.pdf")
         
@@ -262,6 +298,34 @@ TÊN GÓI THẦU (chỉ nội dung cột phải):"""
         ten_goi_thau = self.ask_openai_for_ten_goi_thau(tbmt_content)
         
         print(f"📝 Extracted 'ten_goi_thau': {ten_goi_thau}")
+        return ten_goi_thau
+
+    def process_document(self, doc):
+        """Apply {{ten_goi_thau}} to an already-open Document in place - returns doc, or None on failure"""
+        ten_goi_thau = self.extract_content()
+        if ten_goi_thau is None:
+            return None
+        
+        if not self.replace_placeholder_in_doc(doc, "{{ten_goi_thau}}", ten_goi_thau):
+            return None
+        return doc
+
+    def test_ten_goi_thau_extraction(self):
+        """Test extraction of 'ten_goi_thau' from TBMT.pdf"""
+        print("\n🧪 TESTING: {{ten_goi_thau}} extraction from TBMT.pdf")
+        print("=" * 60)
+        
+        ten_goi_thau = self.extract_content()
+        if ten_goi_thau is None:
+            return False
+        
+        # Fast path: plain-text substitution straight into the DOCX zip
+        if os.path.exists(self.template_file):
+            if fast_replace_text_placeholders(self.template_file, self.output_file, {"ten_goi_thau": ten_goi_thau}):
+                print(f"✅ SUCCESS: {{ten_goi_thau}} has been processed!")
+                print(f"📄 Check output file: {self.output_file}")
+                return True
+            print("⚠️ Placeholder split across runs (or value needs python-docx) - falling back to python-docx")
         
         # Copy template and replace placeholder
         if self.copy_template_to_output():
@@ -3,6 +3,7 @@ import shutil
 from pathlib import Path
 import openai
 from docx import Document
+from docx.oxml.ns import qn
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_ALIGN_VERTICAL
@@ -342,21 +343,16 @@ EXTRACTED SECTION:
         for table in source_doc.tables:
             all_elements.append(('table', table))
 
-        # Replace placeholder
-        for i, paragraph in enumerate(doc.paragraphs):
-            if placeholder_tag in paragraph.text:
-                p_element = paragraph._element
+        # Replace placeholder - walk body paragraphs and stop at the first match
+        w_t = qn('w:t')
+        for p_element in doc.element.body.iterchildren(qn('w:p')):
+            if placeholder_tag in ''.join(t.text or '' for t in p_element.iter(w_t)):
                 parent = p_element.getparent()
                 index = parent.index(p_element)
                 parent.remove(p_element)
 
-                for element_type, element in reversed(all_elements):
-                    if element_type == 'paragraph':
-                        new_p = deepcopy(element._element)
-                        parent.insert(index, new_p)
-                    elif element_type == 'table':
-                        new_t = deepcopy(element._element)
-                        parent.insert(index, new_t)
+                new_elems = [deepcopy(element._element) for _, element in all_elements]
+                parent[index:index] = new_elems
                 break
 
     def copy_template_to_output(self):
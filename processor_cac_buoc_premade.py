@@ -3,6 +3,7 @@ import shutil
 from pathlib import Path
 import openai
 from docx import Document
+from docx.oxml.ns import qn
 from docx.shared import Pt
 import PyPDF2
 from dotenv import load_dotenv
@@ -148,26 +149,21 @@ STEP COUNT:"""
         
         print(f"📊 Total elements to copy: {len(all_elements)}")
 
-        # Find and replace placeholder
-        for i, paragraph in enumerate(doc.paragraphs):
-            if placeholder_tag in paragraph.text:
-                print(f"📍 Found placeholder in paragraph {i}")
+        # Find and replace placeholder - walk body paragraphs and stop at the first match
+        w_t = qn('w:t')
+        for p_element in doc.element.body.iterchildren(qn('w:p')):
+            if placeholder_tag in ''.join(t.text or '' for t in p_element.iter(w_t)):
+                print(f"📍 Found placeholder paragraph")
                 
-                p_element = paragraph._element
                 parent = p_element.getparent()
                 index = parent.index(p_element)
                 parent.remove(p_element)
                 
                 print(f"🔄 Copying {len(all_elements)} elements...")
 
-                # Insert all elements from source
-                for element_type, element in reversed(all_elements):
-                    if element_type == 'paragraph':
-                        new_p = deepcopy(element._element)
-                        parent.insert(index, new_p)
-                    elif element_type == 'table':
-                        new_t = deepcopy(element._element)
-                        parent.insert(index, new_t)
+                # Insert all elements from source in a single splice
+                new_elems = [deepcopy(element._element) for _, element in all_elements]
+                parent[index:index] = new_elems
                 
                 print(f"✅ Successfully copied all elements")
                 break
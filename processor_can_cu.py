@@ -5,14 +5,18 @@ import openai
 from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-import PyPDF2
 from dotenv import load_dotenv
+from docx_placeholders import find_placeholder_paragraphs
+from openai_session import use_shared_openai_session
+from pdf_text import read_pdf_text
 import re
 from copy import deepcopy
 
 # Load environment variables
 load_dotenv()
 
+_PLACEHOLDER_RE = re.compile(r"\{\{(.+?)\}\}")
+
 class CanCuPhapLyProcessor:
     def __init__(self):
         """Initialize the processor for {{can_cu_phap_ly}} following proven process"""
@@ -21,6 +25,7 @@ class CanCuPhapLyProcessor:
             raise ValueError("❌ OPENAI_API_KEY not found in .env file!")
         
         openai.api_key = self.openai_api_key
+        use_shared_openai_session()
         
         self.pdf_folder = Path("pdf_inputs")
         self.template_file = "02_MUC_DO_HIEU_BIET_template.docx"
@@ -33,14 +38,9 @@ class CanCuPhapLyProcessor:
         print(f"🎯 CanCuPhapLyProcessor initialized using proven process")
 
     def extract_text_from_pdf(self, pdf_path):
-        """Extract text content from PDF file"""
+        """Extract text content from PDF file (PyMuPDF, cached per path + mtime)"""
         try:
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+            return read_pdf_text(pdf_path)
         except Exception as e:
             print(f"❌ Error reading {pdf_path}: {str(e)}")
             return None
@@ -48,6 +48,7 @@ class CanCuPhapLyProcessor:
     def format_text_markdown(self, input_text, system_prompt):
         """Your proven OpenAI formatting function"""
         try:
+            # Fixed system prompt first, document text last - the static prefix stays cacheable (OpenAI prompt caching)
             response = openai.ChatCompletion.create(
                 model='gpt-4o',
                 messages=[
@@ -198,15 +199,15 @@ Start extraction from the first document group heading, not from section headers
 
                 i += 1
 
-    def replace_placeholder(self, doc, placeholder_tag):
-        """Your proven placeholder replacement method"""
+    def replace_placeholder(self, doc, placeholder_tag, paragraph=None):
+        """Your proven placeholder replacement method - paragraph: the one holding it, if known"""
         # Extract folder name from tag, e.g. {{can_cu_phap_ly}} -> can_cu_phap_ly
-        match = re.search(r"\{\{(.+?)\}\}", placeholder_tag)
+        match = _PLACEHOLDER_RE.search(placeholder_tag)
         if not match:
             raise ValueError(f"Invalid placeholder: {placeholder_tag}")
         
         tag_name = match.group(1)
-        source_path = Path(f"processed/{tag_name}/output.docx")
+        source_path = self.process_folder.parent / tag_name / "output.docx"
 
         if not source_path.exists():
             raise FileNotFoundError(f"Missing source doc: {source_path}")
@@ -214,33 +215,36 @@ Start extraction from the first document group heading, not from section headers
         source_doc = Document(source_path)
         source_paragraphs = [p for p in source_doc.paragraphs if p.text.strip()]
 
-        for i, paragraph in enumerate(doc.paragraphs):
-            if placeholder_tag in paragraph.text:
-                p_element = paragraph._element
-                parent = p_element.getparent()
-                index = parent.index(p_element)
-                parent.remove(p_element)
-
-                for src_p in reversed(source_paragraphs):
-                    new_p = deepcopy(src_p._element)
-                    parent.insert(index, new_p)
-                    inserted_p = doc.paragraphs[index]
-
-                    inserted_p.paragraph_format.line_spacing = src_p.paragraph_format.line_spacing or 1.3
-                    inserted_p.paragraph_format.space_before = src_p.paragraph_format.space_before
-                    inserted_p.paragraph_format.space_after = src_p.paragraph_format.space_after
-                    inserted_p.paragraph_format.left_indent = src_p.paragraph_format.left_indent
-                    inserted_p.paragraph_format.first_line_indent = src_p.paragraph_format.first_line_indent
-
-                    for run_idx, run in enumerate(inserted_p.runs):
-                        try:
-                            src_run = src_p.runs[run_idx]
-                            run.font.size = src_run.font.size or Pt(14)
-                            run.font.name = src_run.font.name or "Times New Roman"
-                        except IndexError:
-                            run.font.size = Pt(14)
-                            run.font.name = "Times New Roman"
-                break
+        # Find placeholder paragraph - unless the caller already located it
+        if paragraph is not None:
+            p_elements = [paragraph._element]
+        else:
+            p_elements = find_placeholder_paragraphs(doc.element.body, placeholder_tag)
+        if p_elements:
+            p_element = p_elements[0]
+            parent = p_element.getparent()
+            index = parent.index(p_element)
+            parent.remove(p_element)
+
+            for src_p in reversed(source_paragraphs):
+                new_p = deepcopy(src_p._element)
+                parent.insert(index, new_p)
+                inserted_p = doc.paragraphs[index]
+
+                inserted_p.paragraph_format.line_spacing = src_p.paragraph_format.line_spacing or 1.3
+                inserted_p.paragraph_format.space_before = src_p.paragraph_format.space_before
+                inserted_p.paragraph_format.space_after = src_p.paragraph_format.space_after
+                inserted_p.paragraph_format.left_indent = src_p.paragraph_format.left_indent
+                inserted_p.paragraph_format.first_line_indent = src_p.paragraph_format.first_line_indent
+
+                for run_idx, run in enumerate(inserted_p.runs):
+                    try:
+                        src_run = src_p.runs[run_idx]
+                        run.font.size = src_run.font.size or Pt(14)
+                        run.font.name = src_run.font.name or "Times New Roman"
+                    except IndexError:
+                        run.font.size = Pt(14)
+                        run.font.name = "Times New Roman"
 
     def copy_template_to_output(self):
         """Copy template file to output file"""
@@ -257,22 +261,19 @@ Start extraction from the first document group heading, not from section headers
             print(f"❌ Error copying template: {str(e)}")
             return False
 
-    def test_can_cu_phap_ly_full_process(self):
-        """Test using complete proven process for legal basis"""
-        print("\n🧪 TESTING: {{can_cu_phap_ly}} - Full Proven Process")
-        print("=" * 60)
-        
+    def extract_content(self):
+        """Steps 1-3: CHUONG_V.pdf → markdown → processed/can_cu_phap_ly/output.docx - returns its path or None"""
         # Check if CHUONG_V.pdf exists
         chuong_v_file = self.pdf_folder / self.pdf_files['CHUONG_V']
         if not chuong_v_file.exists():
             print(f"❌ File not found: {chuong_v_file}")
-            return False
+            return None
         
         # Step 1: Extract text from PDF
         print("📖 Step 1: Reading CHUONG_V.pdf...")
         chuong_v_content = self.extract_text_from_pdf(chuong_v_file)
         if not chuong_v_content:
-            return False
+            return None
         
         # Save input text
         (self.process_folder / 'input.txt').write_text(chuong_v_content, encoding='utf-8')
@@ -284,11 +285,27 @@ Start extraction from the first document group heading, not from section headers
         
         if markdown_content == "[KHÔNG TÌM THẤY]":
             print("❌ Failed to process to markdown")
-            return False
+            return None
         
         # Step 3: Convert markdown to DOCX
         print("📄 Step 3: Converting markdown to DOCX...")
-        docx_path = self.markdown_to_docx(markdown_content)
+        return self.markdown_to_docx(markdown_content)
+
+    def process_document(self, doc):
+        """Apply {{can_cu_phap_ly}} to an already-open Document in place - returns doc, or None on failure"""
+        if not self.extract_content():
+            return None
+        
+        self.replace_placeholder(doc, "{{can_cu_phap_ly}}")
+        return doc
+
+    def test_can_cu_phap_ly_full_process(self):
+        """Test using complete proven process for legal basis"""
+        print("\n🧪 TESTING: {{can_cu_phap_ly}} - Full Proven Process")
+        print("=" * 60)
+        
+        if not self.extract_content():
+            return False
         
         # Step 4: Replace placeholder using proven method
         print("🔄 Step 4: Replacing placeholder in template...")
@@ -6,8 +6,10 @@ from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_ALIGN_VERTICAL
-import PyPDF2
 from dotenv import load_dotenv
+from docx_placeholders import find_placeholder_paragraphs
+from openai_session import use_shared_openai_session
+from pdf_text import read_pdf_text
 import re
 from copy import deepcopy
 import csv
@@ -16,6 +18,8 @@ from io import StringIO
 # Load environment variables
 load_dotenv()
 
+_PLACEHOLDER_RE = re.compile(r"\{\{(.+?)\}\}")
+
 class PhamViCungCapProcessor:
     def __init__(self):
         """Initialize the processor for {{pham_vi_cung_cap}} - simple table extraction"""
@@ -24,6 +28,7 @@ class PhamViCungCapProcessor:
             raise ValueError("❌ OPENAI_API_KEY not found in .env file!")
         
         openai.api_key = self.openai_api_key
+        use_shared_openai_session()
         
         self.pdf_folder = Path("pdf_inputs")
         self.template_file = "02_MUC_DO_HIEU_BIET_template.docx"
@@ -36,14 +41,9 @@ class PhamViCungCapProcessor:
         print(f"🎯 PhamViCungCapProcessor initialized - simple table extraction")
 
     def extract_text_from_pdf(self, pdf_path):
-        """Extract text content from PDF file"""
+        """Extract text content from PDF file (PyMuPDF, cached per path + mtime)"""
         try:
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+            return read_pdf_text(pdf_path)
         except Exception as e:
             print(f"❌ Error reading {pdf_path}: {str(e)}")
             return None
@@ -133,21 +133,14 @@ CSV TABLE (preserve exact number formats):
         """Convert CSV data to properly formatted DOCX table"""
         print(f"📊 Processing CSV data: {len(csv_data)} characters")
         
-        lines = csv_data.strip().splitlines()
-        print(f"📊 CSV has {len(lines)} lines")
-        
-        # Parse CSV with better handling
-        parsed_rows = []
-        for i, line in enumerate(lines):
-            if line.strip():
-                try:
-                    reader = csv.reader(StringIO(line))
-                    row = next(reader)
-                    parsed_rows.append(row)
-                    print(f"Row {i}: {len(row)} columns - {row}")
-                except Exception as e:
-                    print(f"⚠️ Error parsing line {i}: {e}")
-                    continue
+        # Parse the whole CSV in a single pass, dropping blank rows
+        try:
+            parsed_rows = [row for row in csv.reader(StringIO(csv_data.strip())) if any(cell.strip() for cell in row)]
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV data: {e}")
+
+        for i, row in enumerate(parsed_rows):
+            print(f"Row {i}: {len(row)} columns - {row}")
 
         if not parsed_rows:
             raise ValueError("No valid table data found")
@@ -165,10 +158,7 @@ CSV TABLE (preserve exact number formats):
         print(f"📊 Table will have {num_cols} columns")
 
         # Calculate intelligent column widths
-        max_lengths = [0] * num_cols
-        for row in parsed_rows:
-            for i in range(min(len(row), num_cols)):
-                max_lengths[i] = max(max_lengths[i], len(str(row[i])))
+        max_lengths = [max((len(row[j]) for row in parsed_rows if j < len(row)), default=0) for j in range(num_cols)]
 
         # Set column widths (total 7 inches)
         total_width = 7.0
@@ -237,15 +227,14 @@ CSV TABLE (preserve exact number formats):
         
         return docx_path
 
-    def replace_placeholder(self, doc, placeholder_tag):
-        """Replace placeholder using proven method with better debugging"""
-        pattern = r"\{\{(.+?)\}\}"
-        match = re.search(pattern, placeholder_tag)
+    def replace_placeholder(self, doc, placeholder_tag, paragraph=None):
+        """Replace placeholder using proven method with better debugging - paragraph: the one holding it, if known"""
+        match = _PLACEHOLDER_RE.search(placeholder_tag)
         if not match:
             raise ValueError(f"Invalid placeholder: {placeholder_tag}")
         
         tag_name = match.group(1)
-        source_path = Path(f"processed/{tag_name}/output.docx")
+        source_path = self.process_folder.parent / tag_name / "output.docx"
 
         print(f"🔍 Looking for source file: {source_path}")
         if not source_path.exists():
@@ -271,29 +260,26 @@ CSV TABLE (preserve exact number formats):
         
         print(f"📊 Total elements to copy: {len(all_elements)}")
 
-        # Find and replace placeholder
-        for i, paragraph in enumerate(doc.paragraphs):
-            if placeholder_tag in paragraph.text:
-                print(f"📍 Found placeholder in paragraph {i}")
-                
-                p_element = paragraph._element
-                parent = p_element.getparent()
-                index = parent.index(p_element)
-                parent.remove(p_element)
-                
-                print(f"🔄 Copying {len(all_elements)} elements...")
-
-                # Insert all elements from source
-                for element_type, element in reversed(all_elements):
-                    if element_type == 'paragraph':
-                        new_p = deepcopy(element._element)
-                        parent.insert(index, new_p)
-                    elif element_type == 'table':
-                        new_t = deepcopy(element._element)
-                        parent.insert(index, new_t)
-                
-                print(f"✅ Successfully copied all elements")
-                break
+        # Find placeholder paragraph - unless the caller already located it
+        if paragraph is not None:
+            p_elements = [paragraph._element]
+        else:
+            p_elements = find_placeholder_paragraphs(doc.element.body, placeholder_tag)
+        if p_elements:
+            p_element = p_elements[0]
+            print(f"📍 Found placeholder paragraph")
+            
+            parent = p_element.getparent()
+            index = parent.index(p_element)
+            parent.remove(p_element)
+            
+            print(f"🔄 Copying {len(all_elements)} elements...")
+
+            # Insert all elements from source in a single splice
+            new_elems = [deepcopy(element._element) for _, element in all_elements]
+            parent[index:index] = new_elems
+            
+            print(f"✅ Successfully copied all elements")
 
     def copy_template_to_output(self):
         """Copy template file to output file"""
@@ -310,22 +296,19 @@ CSV TABLE (preserve exact number formats):
             print(f"❌ Error copying template: {str(e)}")
             return False
 
-    def test_pham_vi_cung_cap_simple(self):
-        """Simple table extraction and processing"""
-        print("\n🧪 TESTING: {{pham_vi_cung_cap}} - Simple Table Extraction")
-        print("=" * 60)
-        
+    def extract_content(self):
+        """Steps 1-3: BMMT.pdf → CSV → processed/pham_vi_cung_cap/output.docx - returns its path or None"""
         # Check if BMMT.pdf exists
         bmmt_file = self.pdf_folder / 'BMMT.pdf'
         if not bmmt_file.exists():
             print(f"❌ File not found: {bmmt_file}")
-            return False
+            return None
         
         # Step 1: Extract text from PDF
         print("📖 Step 1: Reading BMMT.pdf...")
         bmmt_content = self.extract_text_from_pdf(bmmt_file)
         if not bmmt_content:
-            return False
+            return None
         
         print(f"✅ Extracted {len(bmmt_content)} characters")
         
@@ -335,7 +318,7 @@ CSV TABLE (preserve exact number formats):
         
         if not csv_data:
             print("❌ Failed to extract table")
-            return False
+            return None
         
         # Save CSV data
         (self.process_folder / 'input.txt').write_text(csv_data, encoding='utf-8')
@@ -344,9 +327,25 @@ CSV TABLE (preserve exact number formats):
         # Step 3: Create DOCX table
         print("🔄 Step 3: Creating formatted table...")
         try:
-            docx_path = self.create_docx_table(csv_data)
+            return self.create_docx_table(csv_data)
         except Exception as e:
             print(f"❌ Failed to create table: {str(e)}")
+            return None
+
+    def process_document(self, doc):
+        """Apply {{pham_vi_cung_cap}} to an already-open Document in place - returns doc, or None on failure"""
+        if not self.extract_content():
+            return None
+        
+        self.replace_placeholder(doc, "{{pham_vi_cung_cap}}")
+        return doc
+
+    def test_pham_vi_cung_cap_simple(self):
+        """Simple table extraction and processing"""
+        print("\n🧪 TESTING: {{pham_vi_cung_cap}} - Simple Table Extraction")
+        print("=" * 60)
+        
+        if not self.extract_content():
             return False
         
         # Step 4: Replace placeholder
@@ -8,6 +8,7 @@ Helps you prepare everything needed for the walking skeleton test
 import os
 from pathlib import Path
 import sys
+from importlib.metadata import distribution, PackageNotFoundError
 
 def check_python_version():
     """Check Python version"""
@@ -62,7 +63,12 @@ def check_required_python_files():
         "processor_pham_vi.py", 
         "processor_can_cu.py",
         "processor_muc_dich.py",
-        "combined_processor.py"
+        "combined_processor.py",
+        "openai_session.py",
+        "pdf_text.py",
+        "docx_placeholders.py",
+        "bounded_cache.py",
+        "api_common.py"
     ]
     
     print("🔍 Checking Python processors...")
@@ -162,16 +168,18 @@ def install_requirements():
         "python-docx",
         "PyPDF2",
         "PyMuPDF",
-        "python-dotenv"
+        "python-dotenv",
+        "aiofiles"
     ]
     
     missing_packages = []
     
+    # Read installed dist-info metadata only - never import the heavy packages
     for package in required_packages:
         try:
-            __import__(package.replace("-", "_"))
+            distribution(package)
             print(f"✅ {package}")
-        except ImportError:
+        except PackageNotFoundError:
             print(f"❌ {package}")
             missing_packages.append(package)
     
@@ -6,9 +6,10 @@ Separate module - doesn't touch the core replacement function
 """
 
 import os
-import fitz  # PyMuPDF
 import openai
 from dotenv import load_dotenv
+from openai_session import use_shared_openai_session
+from pdf_text import extract_pages_text
 
 # Load environment variables
 load_dotenv()
@@ -21,6 +22,7 @@ class StepDetector:
             raise ValueError("❌ OPENAI_API_KEY not found in .env file!")
         
         openai.api_key = self.openai_api_key
+        use_shared_openai_session()
         print("✅ StepDetector initialized")
 
     def extract_pdf_text_pymupdf(self, pdf_path):
@@ -31,21 +33,11 @@ class StepDetector:
         try:
             print(f"📖 Extracting text from: {pdf_path}")
             
-            # Open PDF
-            doc = fitz.open(pdf_path)
-            text = ""
-            page_count = len(doc)  # Get page count before processing
+            # Page-marked text; large PDFs are split into page ranges across the shared
+            # pdf_text worker pool (fitz.Document is not thread-safe)
+            text = extract_pages_text(pdf_path)
             
-            # Extract text from all pages
-            for page_num in range(page_count):
-                page = doc.load_page(page_num)
-                page_text = page.get_text()
-                text += f"\n--- PAGE {page_num + 1} ---\n"
-                text += page_text
-            
-            doc.close()
-            
-            print(f"✅ Extracted {len(text)} characters from {page_count} pages")
+            print(f"✅ Extracted {len(text)} characters")
             return text
             
         except Exception as e:
@@ -5,10 +5,77 @@ Test Walking Skeleton Locally - FIXED VERSION
 This tests your complete workflow using existing modular methods
 """
 
+import asyncio
 import os
 import shutil
+import types
 from pathlib import Path
 
+from docx import Document
+from docx.oxml.ns import qn
+
+from processor import VietnameseProcurementProcessor
+from processor_pham_vi import PhamViCungCapProcessor
+from processor_can_cu import CanCuPhapLyProcessor
+from processor_muc_dich import MucDichProcessor
+from combined_processor import CombinedProcessor
+from docx_placeholders import find_placeholder_paragraphs
+
+OUTPUT_FILE = "02_MUC_DO_HIEU_BIET_output.docx"
+W_P, W_TBL = qn('w:p'), qn('w:tbl')
+
+# WS_VERBOSE=0 silences step-by-step progress; pass/fail summaries always print
+VERBOSE = os.environ.get("WS_VERBOSE", "1") == "1"
+
+def vprint(*args, **kwargs):
+    if VERBOSE:
+        print(*args, **kwargs)
+
+def _noop_copy(self):
+    """Template and output are the same file - nothing to copy"""
+    return True
+
+def wire_inplace(p, path):
+    """Point a processor's template and output at the shared accumulated file"""
+    p.template_file = p.output_file = path
+    p.copy_template_to_output = types.MethodType(_noop_copy, p)
+    return p
+
+def _plain_insert_content(self, doc, content_path, placeholder="{{cac_buoc_thuc_hien}}"):
+    """In-memory {{cac_buoc_thuc_hien}} insert - plain element move, no formatting enhancements"""
+    vprint(f"🔄 Working directly on in-memory document: {content_path}")
+    # Loaded fresh on every call - its nodes are moved out below, so a parsed copy can't be cached
+    source_doc = Document(content_path)
+
+    # Get all content from source - one pass over the body, in document order
+    all_elements = []
+
+    for child in source_doc.element.body.iterchildren():
+        if child.tag == W_P:
+            if child.xpath('string(.)').strip():
+                all_elements.append(('paragraph', child))
+        elif child.tag == W_TBL:
+            all_elements.append(('table', child))
+
+    vprint(f"📊 Total elements to copy: {len(all_elements)}")
+
+    # Find placeholder paragraph
+    matches = find_placeholder_paragraphs(doc.element.body, placeholder)
+    if not matches:
+        print(f"❌ Placeholder '{placeholder}' not found!")
+        return False
+
+    p_element = matches[0]
+    parent = p_element.getparent()
+    index = parent.index(p_element)
+    vprint(f"📍 Found placeholder at body index {index}")
+    parent.remove(p_element)
+
+    # Move all elements in one splice - source_doc is discarded, so no copy needed
+    parent[index:index] = [element for _, element in all_elements]
+
+    return True
+
 class LocalWalkingSkeletonTest:
     """Test the complete walking skeleton workflow locally"""
     
@@ -29,9 +96,19 @@ class LocalWalkingSkeletonTest:
         print("🔍 CHECKING REQUIRED FILES...")
         print("=" * 50)
         
+        # One directory listing per folder instead of one stat() per file
+        present = {}
+        for directory in {os.path.dirname(file_path) or "." for file_path in self.required_files}:
+            try:
+                with os.scandir(directory) as entries:
+                    present[directory] = {entry.name for entry in entries}
+            except FileNotFoundError:
+                present[directory] = set()
+        
         missing_files = []
         for file_path in self.required_files:
-            if not Path(file_path).exists():
+            directory, name = os.path.split(file_path)
+            if name not in present[directory or "."]:
                 missing_files.append(file_path)
                 print(f"❌ Missing: {file_path}")
             else:
@@ -49,195 +126,113 @@ class LocalWalkingSkeletonTest:
     
     def clean_previous_outputs(self):
         """Clean up any previous outputs"""
-        print("\n🧹 CLEANING PREVIOUS OUTPUTS...")
+        vprint("\n🧹 CLEANING PREVIOUS OUTPUTS...")
+        
+        # Main output + backup files, removed without a separate exists() probe
+        targets = [
+            "02_MUC_DO_HIEU_BIET_output.docx",
+            "step1_ten_goi_thau.docx",
+            "step2_pham_vi.docx",
+            "step3_can_cu.docx",
+            "step4_muc_dich.docx"
+        ]
+        
+        def _rm(path):
+            try:
+                os.remove(path)
+                return True
+            except FileNotFoundError:
+                return False
         
-        # Clean main output
-        output_file = "02_MUC_DO_HIEU_BIET_output.docx"
-        if Path(output_file).exists():
-            os.remove(output_file)
-            print(f"🗑️ Removed: {output_file}")
+        def _rmtree(path):
+            if not os.path.isdir(path):
+                return False
+            shutil.rmtree(path, ignore_errors=True)
+            return True
         
-        # Clean processed folders
-        processed_dir = Path("processed")
-        if processed_dir.exists():
-            shutil.rmtree(processed_dir)
-            print(f"🗑️ Removed: {processed_dir}")
+        async def _cleanup():
+            # Independent blocking deletes - overlap them on the default thread pool
+            loop = asyncio.get_running_loop()
+            return await asyncio.gather(
+                *(loop.run_in_executor(None, _rm, path) for path in targets),
+                loop.run_in_executor(None, _rmtree, "processed")
+            )
         
-        # Clean backup files
-        for backup_file in ["step1_ten_goi_thau.docx", "step2_pham_vi.docx", "step3_can_cu.docx", "step4_muc_dich.docx"]:
-            if Path(backup_file).exists():
-                os.remove(backup_file)
-                print(f"🗑️ Removed: {backup_file}")
+        removed = asyncio.run(_cleanup())
+        for path, was_removed in zip(targets + ["processed"], removed):
+            if was_removed:
+                vprint(f"🗑️ Removed: {path}")
         
-        print("✅ Cleanup complete")
+        vprint("✅ Cleanup complete")
     
     def test_complete_workflow(self):
         """Test using existing modular methods - sequential accumulation"""
-        print("\n🚀 TESTING COMPLETE WALKING SKELETON WORKFLOW")
-        print("=" * 60)
-        print("🎯 Target: Generate 02_MUC_DO_HIEU_BIET_output.docx")
-        print("📋 Each module works independently, accumulate results sequentially")
-        print("=" * 60)
+        vprint("\n🚀 TESTING COMPLETE WALKING SKELETON WORKFLOW")
+        vprint("=" * 60)
+        vprint("🎯 Target: Generate 02_MUC_DO_HIEU_BIET_output.docx")
+        vprint("📋 Each module works independently, accumulate results sequentially")
+        vprint("=" * 60)
         
         try:
-            # Step 1: {{ten_goi_thau}} - let module do its complete work
-            print("📋 Step 1/5: Calling processor.test_ten_goi_thau_extraction()...")
-            from processor import VietnameseProcurementProcessor
+            # Load the template ONCE - every step mutates this same in-memory Document
             processor1 = VietnameseProcurementProcessor()
-            success1 = processor1.test_ten_goi_thau_extraction()
-            if not success1:
-                raise Exception("❌ STEP 1 FAILED: {{ten_goi_thau}}")
-            print("✅ Step 1 SUCCESS: {{ten_goi_thau}} processed")
+            vprint(f"📂 Loading template once: {processor1.template_file}")
+            doc = Document(processor1.template_file)
+            wire_inplace(processor1, OUTPUT_FILE)
             
-            # Step 2: {{pham_vi_cung_cap}} - let module work on the existing output
-            print("📊 Step 2/5: Calling processor_pham_vi.test_pham_vi_cung_cap_simple()...")
-            from processor_pham_vi import PhamViCungCapProcessor
-            processor2 = PhamViCungCapProcessor()
-            # Make sure it works on the current output (which has {{ten_goi_thau}} already replaced)
-            processor2.template_file = "02_MUC_DO_HIEU_BIET_output.docx"  # Use current output as template
-            processor2.output_file = "02_MUC_DO_HIEU_BIET_output.docx"    # Save to same file
-            
-            # Override the copy method to handle same file case
-            original_copy_method = processor2.copy_template_to_output
-            def smart_copy():
-                if processor2.template_file == processor2.output_file:
-                    print(f"✅ Template and output are same file - no copy needed")
-                    return True
-                return original_copy_method()
-            processor2.copy_template_to_output = smart_copy
+            # Step 1: {{ten_goi_thau}}
+            vprint("📋 Step 1/5: Calling processor.process_document()...")
+            doc = processor1.process_document(doc)
+            if doc is None:
+                raise Exception("❌ STEP 1 FAILED: {{ten_goi_thau}}")
+            vprint("✅ Step 1 SUCCESS: {{ten_goi_thau}} processed")
             
-            success2 = processor2.test_pham_vi_cung_cap_simple()
-            if not success2:
+            # Step 2: {{pham_vi_cung_cap}} - on the in-memory Step 1 result
+            vprint("📊 Step 2/5: Calling processor_pham_vi.process_document()...")
+            processor2 = wire_inplace(PhamViCungCapProcessor(), OUTPUT_FILE)
+            doc = processor2.process_document(doc)
+            if doc is None:
                 raise Exception("❌ STEP 2 FAILED: {{pham_vi_cung_cap}}")
-            print("✅ Step 2 SUCCESS: {{pham_vi_cung_cap}} processed")
+            vprint("✅ Step 2 SUCCESS: {{pham_vi_cung_cap}} processed")
             
-            # Step 3: {{can_cu_phap_ly}} - let module work on the existing output
-            print("📜 Step 3/5: Calling processor_can_cu.test_can_cu_phap_ly_full_process()...")
-            from processor_can_cu import CanCuPhapLyProcessor
-            processor3 = CanCuPhapLyProcessor()
-            # Make sure it works on the current output (which has {{ten_goi_thau}} + {{pham_vi_cung_cap}} already replaced)
-            processor3.template_file = "02_MUC_DO_HIEU_BIET_output.docx"  # Use current output as template
-            processor3.output_file = "02_MUC_DO_HIEU_BIET_output.docx"    # Save to same file
-            
-            # Override the copy method to handle same file case
-            original_copy_method3 = processor3.copy_template_to_output
-            def smart_copy3():
-                if processor3.template_file == processor3.output_file:
-                    print(f"✅ Template and output are same file - no copy needed")
-                    return True
-                return original_copy_method3()
-            processor3.copy_template_to_output = smart_copy3
-            
-            success3 = processor3.test_can_cu_phap_ly_full_process()
-            if not success3:
+            # Step 3: {{can_cu_phap_ly}} - on the in-memory Step 2 result
+            vprint("📜 Step 3/5: Calling processor_can_cu.process_document()...")
+            processor3 = wire_inplace(CanCuPhapLyProcessor(), OUTPUT_FILE)
+            doc = processor3.process_document(doc)
+            if doc is None:
                 raise Exception("❌ STEP 3 FAILED: {{can_cu_phap_ly}}")
-            print("✅ Step 3 SUCCESS: {{can_cu_phap_ly}} processed")
-            
-            # Step 4: {{muc_dich_cong_viec}} - let module work on the existing output
-            print("🎯 Step 4/5: Calling processor_muc_dich.test_muc_dich_cong_viec_full_process()...")
-            from processor_muc_dich import MucDichProcessor
-            processor4 = MucDichProcessor()
-            # Make sure it works on the current output (which has 3 placeholders already replaced)
-            processor4.template_file = "02_MUC_DO_HIEU_BIET_output.docx"  # Use current output as template
-            processor4.output_file = "02_MUC_DO_HIEU_BIET_output.docx"    # Save to same file
-            
-            # Override the copy method to handle same file case
-            original_copy_method4 = processor4.copy_template_to_output
-            def smart_copy4():
-                if processor4.template_file == processor4.output_file:
-                    print(f"✅ Template and output are same file - no copy needed")
-                    return True
-                return original_copy_method4()
-            processor4.copy_template_to_output = smart_copy4
+            vprint("✅ Step 3 SUCCESS: {{can_cu_phap_ly}} processed")
             
-            success4 = processor4.test_muc_dich_cong_viec_full_process()
-            if not success4:
+            # Step 4: {{muc_dich_cong_viec}} - on the in-memory Step 3 result
+            vprint("🎯 Step 4/5: Calling processor_muc_dich.process_document()...")
+            processor4 = wire_inplace(MucDichProcessor(), OUTPUT_FILE)
+            doc = processor4.process_document(doc)
+            if doc is None:
                 raise Exception("❌ STEP 4 FAILED: {{muc_dich_cong_viec}}")
-            print("✅ Step 4 SUCCESS: {{muc_dich_cong_viec}} processed")
+            vprint("✅ Step 4 SUCCESS: {{muc_dich_cong_viec}} processed")
             
-            # Step 5: {{cac_buoc_thuc_hien}} - let module work on the existing output
-            print("🔄 Step 5/5: Calling combined_processor.process_complete_workflow()...")
-            from combined_processor import CombinedProcessor
-            processor5 = CombinedProcessor()
-            # Make sure it works on the current output (which has 4 placeholders already replaced)
-            processor5.template_file = "02_MUC_DO_HIEU_BIET_output.docx"  # Use current output as template
-            processor5.output_file = "02_MUC_DO_HIEU_BIET_output.docx"    # Save to same file
+            # Step 5: {{cac_buoc_thuc_hien}} - on the in-memory Step 4 result
+            vprint("🔄 Step 5/5: Calling combined_processor.process_document()...")
+            processor5 = wire_inplace(CombinedProcessor(), OUTPUT_FILE)
+            processor5.insert_content = types.MethodType(_plain_insert_content, processor5)
             
-            # Override the replace_placeholder_only method to handle same file case
-            original_replace_method = processor5.replace_placeholder_only
-            def smart_replace(template_path, content_path, output_path, placeholder="{{cac_buoc_thuc_hien}}"):
-                # If template and output are same, don't copy - work directly on the file
-                if template_path == output_path:
-                    print(f"🔄 Working directly on file (no copy needed): {output_path}")
-                    from docx import Document
-                    from copy import deepcopy
-                    
-                    # Load the current document and content document
-                    doc = Document(output_path)
-                    source_doc = Document(content_path)
-                    
-                    # Get all content from source
-                    all_elements = []
-                    
-                    for para in source_doc.paragraphs:
-                        if para.text.strip():
-                            all_elements.append(('paragraph', para))
-                    
-                    for table in source_doc.tables:
-                        all_elements.append(('table', table))
-                    
-                    print(f"📊 Total elements to copy: {len(all_elements)}")
-                    
-                    # Find and replace placeholder
-                    placeholder_found = False
-                    
-                    for i, paragraph in enumerate(doc.paragraphs):
-                        if placeholder in paragraph.text:
-                            print(f"📍 Found placeholder in paragraph {i}")
-                            placeholder_found = True
-                            
-                            # Use the existing replacement logic
-                            p_element = paragraph._element
-                            parent = p_element.getparent()
-                            index = parent.index(p_element)
-                            parent.remove(p_element)
-                            
-                            # Insert all elements
-                            for element_type, element in reversed(all_elements):
-                                if element_type == 'paragraph':
-                                    new_p = deepcopy(element._element)
-                                    parent.insert(index, new_p)
-                                elif element_type == 'table':
-                                    new_t = deepcopy(element._element)
-                                    parent.insert(index, new_t)
-                            
-                            break
-                    
-                    if not placeholder_found:
-                        print(f"❌ Placeholder '{placeholder}' not found!")
-                        return False
-                    
-                    # Save document
-                    doc.save(output_path)
-                    print(f"✅ Document saved: {output_path}")
-                    return True
-                else:
-                    # Different files - use original method
-                    return original_replace_method(template_path, content_path, output_path, placeholder)
-            
-            processor5.replace_placeholder_only = smart_replace
-            
-            success5 = processor5.process_complete_workflow()
-            if not success5:
+            doc = processor5.process_document(doc)
+            if doc is None:
                 raise Exception("❌ STEP 5 FAILED: {{cac_buoc_thuc_hien}}")
-            print("✅ Step 5 SUCCESS: {{cac_buoc_thuc_hien}} processed")
+            vprint("✅ Step 5 SUCCESS: {{cac_buoc_thuc_hien}} processed")
+            
+            # Save ONCE at the end - steps hand the live Document to each other, so there is
+            # no per-step save/reload left to overlap with the next step
+            doc.save(OUTPUT_FILE)
+            vprint(f"💾 Document saved: {OUTPUT_FILE}")
             
             # Final validation
-            output_file = Path("02_MUC_DO_HIEU_BIET_output.docx")
-            if not output_file.exists():
+            output_file = Path(OUTPUT_FILE)
+            try:
+                file_size = os.stat(output_file).st_size
+            except FileNotFoundError:
                 raise Exception("❌ FINAL OUTPUT FILE NOT FOUND!")
             
-            file_size = output_file.stat().st_size
             print(f"\n🎉 SEQUENTIAL ACCUMULATION SUCCESS! 🎉")
             print("=" * 60)
             print(f"📄 Generated: {output_file}")
@@ -6,11 +6,11 @@ Simple FastAPI wrapper for your existing processors
 Goal: Get ONE complete end-to-end flow working first
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+import hashlib
 import os
-import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import zipfile
 from pathlib import Path
 from typing import List
@@ -22,9 +22,37 @@ from processor_pham_vi import PhamViCungCapProcessor
 from processor_can_cu import CanCuPhapLyProcessor
 from processor_muc_dich import MucDichProcessor
 from combined_processor import CombinedProcessor
+from bounded_cache import BoundedCache
+from api_common import WORKSPACE_ROOT, DocxFileResponse, limit_upload_size, save_pdf_upload
 
 app = FastAPI(title="Vietnamese Procurement Document API", version="1.0.0")
 
+app.middleware("http")(limit_upload_size)
+
+@app.on_event("startup")
+async def load_template_blobs():
+    """Read the template once at boot; 21_BUOC.docx / 23_BUOC.docx are optional"""
+    app.state.template_blobs = {"02_MUC_DO_HIEU_BIET_template.docx": Path("02_MUC_DO_HIEU_BIET_template.docx").read_bytes()}
+    for file_name in ["21_BUOC.docx", "23_BUOC.docx"]:
+        source = Path(file_name)
+        if source.exists():
+            app.state.template_blobs[file_name] = source.read_bytes()
+
+# Exact-match LLM answers: same prompt method + same input -> same answer, no API call
+# Locked - the PHASE 1 worker threads share it
+_LLM_CACHE = BoundedCache(max_entries=256, thread_safe=True)
+
+def cached_ask(ask_fn, content):
+    """Call ask_fn(content) once per (prompt method, content) - failures are not cached
+    The model is fixed inside each ask method, and changing it means a restart with an empty cache"""
+    key = hashlib.sha256(f"{ask_fn.__qualname__}\0{content}".encode("utf-8")).hexdigest()
+    answer = _LLM_CACHE.get(key)
+    if answer is None:
+        answer = ask_fn(content)
+        if answer != "[KHÔNG TÌM THẤY]":
+            _LLM_CACHE.set(key, answer)
+    return answer
+
 class WalkingSkeletonProcessor:
     """
     Walking Skeleton: Process ONE template completely
@@ -33,26 +61,30 @@ class WalkingSkeletonProcessor:
     """
     
     def __init__(self):
+        self.workspace = None
         self.work_dir = None
         self.pdf_inputs_dir = None
+        self.ten_goi_thau_content = None
+        self.output_stat = None
         
     def setup_workspace(self):
-        """Create temporary workspace"""
-        self.work_dir = Path(tempfile.mkdtemp())
+        """Create temporary workspace - removed by cleanup(), or on garbage collection if that never runs"""
+        self.workspace = tempfile.TemporaryDirectory(dir=WORKSPACE_ROOT)
+        self.work_dir = Path(self.workspace.name)
         self.pdf_inputs_dir = self.work_dir / "pdf_inputs"
         self.pdf_inputs_dir.mkdir(exist_ok=True)
         print(f"🔧 Created workspace: {self.work_dir}")
         
-    def save_uploaded_pdfs(self, pdf_files: List[UploadFile]):
-        """Save uploaded PDFs to workspace"""
+    async def save_uploaded_pdfs(self, pdf_files: List[UploadFile]):
+        """Save uploaded PDFs to workspace - streamed in 1 MiB chunks without blocking the event loop"""
         expected_files = ['TBMT.pdf', 'BMMT.pdf', 'CHUONG_III.pdf', 'CHUONG_V.pdf', 'HSMT.pdf']
         saved_files = {}
+        received = 0  # across all files - chunked uploads carry no Content-Length for the middleware to check
         
         for pdf_file in pdf_files:
             if pdf_file.filename in expected_files:
                 file_path = self.pdf_inputs_dir / pdf_file.filename
-                with open(file_path, "wb") as f:
-                    shutil.copyfileobj(pdf_file.file, f)
+                received, _ = await save_pdf_upload(pdf_file, file_path, received)
                 saved_files[pdf_file.filename] = file_path
                 print(f"✅ Saved: {pdf_file.filename}")
             else:
@@ -60,6 +92,16 @@ class WalkingSkeletonProcessor:
         
         return saved_files
     
+    def use_workspace(self, processor, output_name="02_MUC_DO_HIEU_BIET_output.docx"):
+        """Point a processor's files at this workspace - absolute paths, no os.chdir needed"""
+        processor.template_file = str(self.work_dir / "02_MUC_DO_HIEU_BIET_template.docx")
+        processor.output_file = str(self.work_dir / output_name)
+        processor.pdf_folder = self.pdf_inputs_dir
+        if hasattr(processor, "process_folder"):
+            processor.process_folder = self.work_dir / "processed" / processor.process_folder.name
+            processor.process_folder.mkdir(parents=True, exist_ok=True)
+        return processor
+    
     def process_muc_do_hieu_biet_template(self):
         """
         FIXED: Call existing modular methods in sequence with proper file management
@@ -68,122 +110,88 @@ class WalkingSkeletonProcessor:
         print("\n🚀 WALKING SKELETON: Orchestrating Existing Modules")
         print("=" * 60)
         
-        # Change working directory to our workspace
-        original_cwd = os.getcwd()
-        os.chdir(self.work_dir)
-        
         try:
-            # Copy template files to workspace
-            template_source = Path(original_cwd) / "02_MUC_DO_HIEU_BIET_template.docx"
+            # Write the startup-cached template + 21_BUOC.docx / 23_BUOC.docx into the workspace
+            for file_name, blob in app.state.template_blobs.items():
+                (self.work_dir / file_name).write_bytes(blob)
             template_dest = self.work_dir / "02_MUC_DO_HIEU_BIET_template.docx"
-            shutil.copy2(template_source, template_dest)
-            
-            # Copy other required files (21_BUOC.docx, 23_BUOC.docx)
-            for file_name in ["21_BUOC.docx", "23_BUOC.docx"]:
-                source = Path(original_cwd) / file_name
-                if source.exists():
-                    shutil.copy2(source, self.work_dir / file_name)
             
-            # PHASE 1: Call each module's existing test method (but manage output carefully)
+            # PHASE 1: Call each module's existing test method
+            # Each step writes its own stepN_*.docx directly - no shared output to back up between steps
             print("\n📋 PHASE 1: Call existing modular methods...")
             
-            # Step 1: {{ten_goi_thau}} - let it create its output
-            print("📋 Step 1: Calling processor.test_ten_goi_thau_extraction()...")
-            processor1 = VietnameseProcurementProcessor()
-            success1 = processor1.test_ten_goi_thau_extraction()
-            if not success1:
-                raise Exception("Failed {{ten_goi_thau}} module")
-            
-            # Backup the result (module creates "02_MUC_DO_HIEU_BIET_output.docx")
-            shutil.copy2("02_MUC_DO_HIEU_BIET_output.docx", "step1_ten_goi_thau.docx")
-            print("✅ Step 1 complete, backed up result")
+            # Build all four processors first - each has its own PDF, step file and process folder
+            processor1 = self.use_workspace(VietnameseProcurementProcessor(), "step1_ten_goi_thau.docx")
+            processor2 = self.use_workspace(PhamViCungCapProcessor(), "step2_pham_vi.docx")
+            processor3 = self.use_workspace(CanCuPhapLyProcessor(), "step3_can_cu.docx")
+            processor4 = self.use_workspace(MucDichProcessor(), "step4_muc_dich.docx")
             
-            # Step 2: {{pham_vi_cung_cap}} - let it do its work
-            print("📊 Step 2: Calling processor_pham_vi.test_pham_vi_cung_cap_simple()...")
-            processor2 = PhamViCungCapProcessor()
-            success2 = processor2.test_pham_vi_cung_cap_simple()
-            if not success2:
-                raise Exception("Failed {{pham_vi_cung_cap}} module")
+            # Route the OpenAI call through the cache and keep the answer for PHASE 2
+            original_ask = processor1.ask_openai_for_ten_goi_thau
+            def remembering_ask(tbmt_content):
+                self.ten_goi_thau_content = cached_ask(original_ask, tbmt_content)
+                return self.ten_goi_thau_content
+            processor1.ask_openai_for_ten_goi_thau = remembering_ask
             
-            # Backup the result
-            shutil.copy2("02_MUC_DO_HIEU_BIET_output.docx", "step2_pham_vi.docx")
-            print("✅ Step 2 complete, backed up result")
+            # Steps 1-4 are independent (TBMT, BMMT, then CHUONG_V for both can_cu and muc_dich) -
+            # run them together so the four OpenAI round trips overlap
+            print("🚀 Steps 1-4: Calling the four test methods concurrently...")
+            steps = [
+                ("{{ten_goi_thau}}", processor1.test_ten_goi_thau_extraction),
+                ("{{pham_vi_cung_cap}}", processor2.test_pham_vi_cung_cap_simple),
+                ("{{can_cu_phap_ly}}", processor3.test_can_cu_phap_ly_full_process),
+                ("{{muc_dich_cong_viec}}", processor4.test_muc_dich_cong_viec_full_process),
+            ]
+            with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+                futures = [pool.submit(test_method) for _, test_method in steps]
             
-            # Step 3: {{can_cu_phap_ly}} - let it do its work
-            print("📜 Step 3: Calling processor_can_cu.test_can_cu_phap_ly_full_process()...")
-            processor3 = CanCuPhapLyProcessor()
-            success3 = processor3.test_can_cu_phap_ly_full_process()
-            if not success3:
-                raise Exception("Failed {{can_cu_phap_ly}} module")
-            
-            # Backup the result
-            shutil.copy2("02_MUC_DO_HIEU_BIET_output.docx", "step3_can_cu.docx")
-            print("✅ Step 3 complete, backed up result")
-            
-            # Step 4: {{muc_dich_cong_viec}} - let it do its work
-            print("🎯 Step 4: Calling processor_muc_dich.test_muc_dich_cong_viec_full_process()...")
-            processor4 = MucDichProcessor()
-            success4 = processor4.test_muc_dich_cong_viec_full_process()
-            if not success4:
-                raise Exception("Failed {{muc_dich_cong_viec}} module")
-            
-            # Backup the result
-            shutil.copy2("02_MUC_DO_HIEU_BIET_output.docx", "step4_muc_dich.docx")
-            print("✅ Step 4 complete, backed up result")
+            for step, ((name, _), future) in enumerate(zip(steps, futures), start=1):
+                if not future.result():
+                    raise Exception(f"Failed {name} module")
+                print(f"✅ Step {step} complete")
             
             # PHASE 2: Now orchestrate the final combination
             print("\n🔄 PHASE 2: Orchestrate final combination...")
             
-            # Start fresh with template
-            shutil.copy2("02_MUC_DO_HIEU_BIET_template.docx", "02_MUC_DO_HIEU_BIET_output.docx")
-            
+            # Start fresh with template - ONE load, all five replacements in memory, ONE save
             from docx import Document
-            doc = Document("02_MUC_DO_HIEU_BIET_output.docx")
+            doc = Document(template_dest)
             
-            # Apply each replacement using the modules' existing replace methods
+            # Apply each replacement using the modules' in-memory replace methods
             print("🔄 Applying {{ten_goi_thau}} from step1...")
-            # Extract the content that was generated and apply it
-            step1_doc = Document("step1_ten_goi_thau.docx")
-            # Find what was replaced by comparing with template
-            # For now, let's use the processor's replacement method
-            processor1.output_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            # Re-extract and apply (reuse the module's logic)
-            tbmt_file = "pdf_inputs/TBMT.pdf"
-            tbmt_content = processor1.extract_text_from_pdf(tbmt_file)
-            ten_goi_thau_content = processor1.ask_openai_for_ten_goi_thau(tbmt_content)
-            processor1.replace_placeholder_in_docx("{{ten_goi_thau}}", ten_goi_thau_content)
+            # Reuse the answer from Step 1 - no second PDF read or OpenAI call
+            if not processor1.replace_placeholder_in_doc(doc, "{{ten_goi_thau}}", self.ten_goi_thau_content):
+                raise Exception("Failed {{ten_goi_thau}} module")
             print("✅ {{ten_goi_thau}} applied")
             
             print("🔄 Applying {{pham_vi_cung_cap}} from step2...")
-            doc = Document("02_MUC_DO_HIEU_BIET_output.docx")
             processor2.replace_placeholder(doc, "{{pham_vi_cung_cap}}")
-            doc.save("02_MUC_DO_HIEU_BIET_output.docx")
             print("✅ {{pham_vi_cung_cap}} applied")
             
             print("🔄 Applying {{can_cu_phap_ly}} from step3...")
-            doc = Document("02_MUC_DO_HIEU_BIET_output.docx")
             processor3.replace_placeholder(doc, "{{can_cu_phap_ly}}")
-            doc.save("02_MUC_DO_HIEU_BIET_output.docx")
             print("✅ {{can_cu_phap_ly}} applied")
             
             print("🔄 Applying {{muc_dich_cong_viec}} from step4...")
-            doc = Document("02_MUC_DO_HIEU_BIET_output.docx")
             processor4.replace_placeholder(doc, "{{muc_dich_cong_viec}}")
-            doc.save("02_MUC_DO_HIEU_BIET_output.docx")
             print("✅ {{muc_dich_cong_viec}} applied")
             
-            # Step 5: {{cac_buoc_thuc_hien}} - let the module do its work LAST
-            print("🔄 Step 5: Calling combined_processor.process_complete_workflow()...")
+            # Step 5: {{cac_buoc_thuc_hien}} - let the module do its work LAST, on the same document
+            print("🔄 Step 5: Calling combined_processor.process_document()...")
             processor5 = CombinedProcessor()
-            success5 = processor5.process_complete_workflow()
-            if not success5:
+            processor5.chuong_v_pdf = str(self.pdf_inputs_dir / "CHUONG_V.pdf")
+            processor5.buoc_folder = self.work_dir
+            if processor5.process_document(doc) is None:
                 raise Exception("Failed {{cac_buoc_thuc_hien}} module")
             
+            doc.save(self.work_dir / "02_MUC_DO_HIEU_BIET_output.docx")
             print("✅ {{cac_buoc_thuc_hien}} applied (final step)")
             
-            # Check if output file exists
+            # Check if output file exists - keep the stat for the response headers
             output_file = self.work_dir / "02_MUC_DO_HIEU_BIET_output.docx"
-            if not output_file.exists():
+            try:
+                self.output_stat = output_file.stat()
+            except FileNotFoundError:
                 raise Exception("Output file not generated")
             
             print(f"\n🎉 MODULAR ORCHESTRATION SUCCESS!")
@@ -193,19 +201,18 @@ class WalkingSkeletonProcessor:
         except Exception as e:
             print(f"❌ Walking skeleton failed: {str(e)}")
             raise
-        finally:
-            os.chdir(original_cwd)
     
     def cleanup(self):
         """Clean up workspace"""
-        if self.work_dir and self.work_dir.exists():
-            shutil.rmtree(self.work_dir)
+        if self.workspace:
+            self.workspace.cleanup()
             print(f"🧹 Cleaned up workspace")
 
 # API Endpoints
 
 @app.post("/api/process-skeleton")
 async def process_walking_skeleton(
+    background_tasks: BackgroundTasks,
     tbmt_pdf: UploadFile = File(..., description="TBMT.pdf file"),
     bmmt_pdf: UploadFile = File(..., description="BMMT.pdf file"),
     chuong_iii_pdf: UploadFile = File(..., description="CHUONG_III.pdf file"),
@@ -224,7 +231,7 @@ async def process_walking_skeleton(
         
         # Save uploaded PDFs
         pdf_files = [tbmt_pdf, bmmt_pdf, chuong_iii_pdf, chuong_v_pdf, hsmt_pdf]
-        saved_files = processor.save_uploaded_pdfs(pdf_files)
+        saved_files = await processor.save_uploaded_pdfs(pdf_files)
         
         # Validate all required PDFs are present
         required = {'TBMT.pdf', 'BMMT.pdf', 'CHUONG_III.pdf', 'CHUONG_V.pdf', 'HSMT.pdf'}
@@ -235,17 +242,23 @@ async def process_walking_skeleton(
         # Process template
         output_file = processor.process_muc_do_hieu_biet_template()
         
+        # Clean up workspace only after the response has been sent
+        background_tasks.add_task(processor.cleanup)
+        
         # Return the generated DOCX file
-        return FileResponse(
+        return DocxFileResponse(
             path=output_file,
             media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            filename="02_MUC_DO_HIEU_BIET_output.docx"
+            filename="02_MUC_DO_HIEU_BIET_output.docx",
+            stat_result=processor.output_stat
         )
         
+    except HTTPException:
+        processor.cleanup()
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
         processor.cleanup()
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/health")
 async def health_check():
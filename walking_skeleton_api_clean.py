@@ -5,16 +5,31 @@ Walking Skeleton FastAPI - Clean Production Version
 Wraps your proven modular workflow in a REST API
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import hashlib
 import os
-import shutil
+import re
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List
 import uvicorn
 import logging
+from copy import copy, deepcopy
+from docx import Document
+
+# Import your existing processors
+from processor import VietnameseProcurementProcessor
+from processor_pham_vi import PhamViCungCapProcessor
+from processor_can_cu import CanCuPhapLyProcessor
+from processor_muc_dich import MucDichProcessor
+from combined_processor import CombinedProcessor
+from pdf_text import extract_pdf_text, extract_text_and_pages, run_pdf_jobs
+from bounded_cache import BoundedCache
+from api_common import WORKSPACE_ROOT, DocxFileResponse, limit_upload_size, save_pdf_upload
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -35,6 +50,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.middleware("http")(limit_upload_size)
+
+# Static files every request needs in its workspace
+_TEMPLATE_FILES = ("02_MUC_DO_HIEU_BIET_template.docx", "21_BUOC.docx", "23_BUOC.docx")
+
+# Shared pool for the five independent extract steps (PDF read + OpenAI call each)
+_EXTRACT_POOL = ThreadPoolExecutor(max_workers=5)
+
+# Any of the five placeholders - one pass over the template locates them all
+_PLACEHOLDER_NAMES = ("ten_goi_thau", "pham_vi_cung_cap", "can_cu_phap_ly", "muc_dich_cong_viec", "cac_buoc_thuc_hien")
+_PLACEHOLDERS_RE = re.compile(r"\{\{(" + "|".join(_PLACEHOLDER_NAMES) + r")\}\}")
+
+# PDFs steps 1-4 read (CHUONG_V.pdf twice) - parsed up front so no step touches fitz from a thread
+_PREFETCH_PDFS = ("TBMT.pdf", "BMMT.pdf", "CHUONG_V.pdf")
+
+async def run_on_pdf_pool(jobs):
+    """Run (fn, *args) jobs on the shared pdf_text worker pool (rebuilt once if a worker died) off the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, run_pdf_jobs, jobs)
+
+# Finished DOCX bytes keyed by the SHA-256 of the five uploaded PDFs
+# Exact match only - every placeholder is a package-specific fact, so a near-duplicate must not hit
+# Only touched from the event loop - no lock needed
+_RESULT_CACHE = BoundedCache(max_entries=32)
+
 class WalkingSkeletonProcessor:
     """
     Production version of your proven walking skeleton workflow
@@ -42,26 +81,31 @@ class WalkingSkeletonProcessor:
     """
     
     def __init__(self):
+        self.workspace = None
         self.work_dir = None
         self.pdf_inputs_dir = None
         self.required_pdfs = ['TBMT.pdf', 'BMMT.pdf', 'CHUONG_III.pdf', 'CHUONG_V.pdf', 'HSMT.pdf']
+        self.output_stat = None
+        self.pdf_digests = {}
+        self.cacheable = False
         
     def setup_workspace(self):
-        """Create temporary workspace for processing"""
-        self.work_dir = Path(tempfile.mkdtemp(prefix="walking_skeleton_"))
+        """Create temporary workspace for processing - removed by cleanup(), or on garbage collection if that never runs"""
+        self.workspace = tempfile.TemporaryDirectory(prefix="walking_skeleton_", dir=WORKSPACE_ROOT)
+        self.work_dir = Path(self.workspace.name)
         self.pdf_inputs_dir = self.work_dir / "pdf_inputs"
         self.pdf_inputs_dir.mkdir(exist_ok=True)
         logger.info(f"Created workspace: {self.work_dir}")
         
-    def save_uploaded_pdfs(self, pdf_files: List[UploadFile]):
-        """Save uploaded PDFs to workspace"""
+    async def save_uploaded_pdfs(self, pdf_files: List[UploadFile]):
+        """Save uploaded PDFs to workspace - streamed in 1 MiB chunks without blocking the event loop"""
         saved_files = {}
+        received = 0  # across all files - chunked uploads carry no Content-Length for the middleware to check
         
         for pdf_file in pdf_files:
             if pdf_file.filename in self.required_pdfs:
                 file_path = self.pdf_inputs_dir / pdf_file.filename
-                with open(file_path, "wb") as f:
-                    shutil.copyfileobj(pdf_file.file, f)
+                received, self.pdf_digests[pdf_file.filename] = await save_pdf_upload(pdf_file, file_path, received)
                 saved_files[pdf_file.filename] = file_path
                 logger.info(f"Saved: {pdf_file.filename} ({file_path.stat().st_size} bytes)")
             else:
@@ -69,202 +113,174 @@ class WalkingSkeletonProcessor:
         
         return saved_files
     
+    def input_key(self):
+        """One cache key for the whole upload - hashed while the PDFs were streamed to disk"""
+        return hashlib.sha256("\n".join(
+            f"{name}:{self.pdf_digests[name]}" for name in self.required_pdfs
+        ).encode("utf-8")).hexdigest()
+    
     def copy_required_templates(self):
-        """Copy required template files to workspace"""
-        required_files = [
-            "02_MUC_DO_HIEU_BIET_template.docx",
-            "21_BUOC.docx",
-            "23_BUOC.docx"
-        ]
-        
-        for file_name in required_files:
-            source = Path(file_name)
-            if source.exists():
-                dest = self.work_dir / file_name
-                shutil.copy2(source, dest)
-                logger.info(f"Copied template: {file_name}")
-            else:
-                raise FileNotFoundError(f"Required template not found: {file_name}")
+        """Write the startup-cached template files into the workspace"""
+        for file_name, blob in app.state.template_blobs.items():
+            (self.work_dir / file_name).write_bytes(blob)
+            logger.info(f"Copied template: {file_name}")
     
-    def process_all_placeholders(self):
+    async def process_all_placeholders(self):
         """
         Execute your proven walking skeleton workflow
-        All 5 placeholders processed sequentially with accumulation
+        All five steps extracted concurrently, then applied to one in-memory document and saved once
         """
         logger.info("Starting walking skeleton workflow...")
         
-        # Change to workspace directory
-        original_cwd = os.getcwd()
-        os.chdir(self.work_dir)
+        # Per-request shallow copies of the startup processors - no re-init, safe to rebind
+        processor1, processor2, processor3, processor4, processor5 = (
+            copy(p) for p in app.state.processors
+        )
         
-        try:
-            # Step 1: {{ten_goi_thau}} - starts the chain
-            logger.info("Step 1/5: Processing {{ten_goi_thau}}...")
-            from processor import VietnameseProcurementProcessor
-            processor1 = VietnameseProcurementProcessor()
-            success1 = processor1.test_ten_goi_thau_extraction()
-            if not success1:
-                raise Exception("Failed Step 1: {{ten_goi_thau}}")
-            logger.info("✅ Step 1 complete: {{ten_goi_thau}}")
-            
-            # Step 2: {{pham_vi_cung_cap}} - accumulates on Step 1 result
-            logger.info("Step 2/5: Processing {{pham_vi_cung_cap}}...")
-            from processor_pham_vi import PhamViCungCapProcessor
-            processor2 = PhamViCungCapProcessor()
-            processor2.template_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            processor2.output_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            
-            # Smart copy override
-            original_copy = processor2.copy_template_to_output
-            def smart_copy():
-                if processor2.template_file == processor2.output_file:
-                    logger.info("Same file - no copy needed")
-                    return True
-                return original_copy()
-            processor2.copy_template_to_output = smart_copy
-            
-            success2 = processor2.test_pham_vi_cung_cap_simple()
-            if not success2:
-                raise Exception("Failed Step 2: {{pham_vi_cung_cap}}")
-            logger.info("✅ Step 2 complete: {{pham_vi_cung_cap}}")
-            
-            # Step 3: {{can_cu_phap_ly}} - accumulates on Step 2 result
-            logger.info("Step 3/5: Processing {{can_cu_phap_ly}}...")
-            from processor_can_cu import CanCuPhapLyProcessor
-            processor3 = CanCuPhapLyProcessor()
-            processor3.template_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            processor3.output_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            
-            # Smart copy override
-            original_copy3 = processor3.copy_template_to_output
-            def smart_copy3():
-                if processor3.template_file == processor3.output_file:
-                    logger.info("Same file - no copy needed")
-                    return True
-                return original_copy3()
-            processor3.copy_template_to_output = smart_copy3
-            
-            success3 = processor3.test_can_cu_phap_ly_full_process()
-            if not success3:
-                raise Exception("Failed Step 3: {{can_cu_phap_ly}}")
-            logger.info("✅ Step 3 complete: {{can_cu_phap_ly}}")
-            
-            # Step 4: {{muc_dich_cong_viec}} - accumulates on Step 3 result
-            logger.info("Step 4/5: Processing {{muc_dich_cong_viec}}...")
-            from processor_muc_dich import MucDichProcessor
-            processor4 = MucDichProcessor()
-            processor4.template_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            processor4.output_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            
-            # Smart copy override
-            original_copy4 = processor4.copy_template_to_output
-            def smart_copy4():
-                if processor4.template_file == processor4.output_file:
-                    logger.info("Same file - no copy needed")
-                    return True
-                return original_copy4()
-            processor4.copy_template_to_output = smart_copy4
-            
-            success4 = processor4.test_muc_dich_cong_viec_full_process()
-            if not success4:
-                raise Exception("Failed Step 4: {{muc_dich_cong_viec}}")
-            logger.info("✅ Step 4 complete: {{muc_dich_cong_viec}}")
-            
-            # Step 5: {{cac_buoc_thuc_hien}} - final accumulation
-            logger.info("Step 5/5: Processing {{cac_buoc_thuc_hien}}...")
-            from combined_processor import CombinedProcessor
-            
-            processor5 = CombinedProcessor()
-            processor5.template_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            processor5.output_file = "02_MUC_DO_HIEU_BIET_output.docx"
-            
-            # FIX: Update the PDF path for API workspace
-            processor5.chuong_v_pdf = "pdf_inputs/CHUONG_V.pdf"
-            
-            # Debug: Check if files exist
-            template_exists = Path("02_MUC_DO_HIEU_BIET_output.docx").exists()
-            buoc21_exists = Path("21_BUOC.docx").exists()
-            buoc23_exists = Path("23_BUOC.docx").exists()
-            chuong_v_exists = Path("pdf_inputs/CHUONG_V.pdf").exists()
-            logger.info(f"Files check - Template: {template_exists}, 21_BUOC: {buoc21_exists}, 23_BUOC: {buoc23_exists}, CHUONG_V: {chuong_v_exists}")
-            
-            # Override the replace method for same file handling
-            original_replace = processor5.replace_placeholder_only
-            def smart_replace_final(template_path, content_path, output_path, placeholder="{{cac_buoc_thuc_hien}}"):
-                logger.info(f"Smart replace: {template_path} -> {output_path}")
-                
-                if template_path == output_path:
-                    logger.info("Working directly on file")
-                    
-                    from docx import Document
-                    from copy import deepcopy
-                    
-                    doc = Document(output_path)
-                    source_doc = Document(content_path)
-                    
-                    # Get content elements
-                    all_elements = []
-                    for para in source_doc.paragraphs:
-                        if para.text.strip():
-                            all_elements.append(('paragraph', para))
-                    for table in source_doc.tables:
-                        all_elements.append(('table', table))
-                    
-                    logger.info(f"Found {len(all_elements)} elements to copy")
-                    
-                    # Find and replace placeholder
-                    for i, paragraph in enumerate(doc.paragraphs):
-                        if placeholder in paragraph.text:
-                            logger.info(f"Found placeholder in paragraph {i}")
-                            
-                            p_element = paragraph._element
-                            parent = p_element.getparent()
-                            index = parent.index(p_element)
-                            parent.remove(p_element)
-                            
-                            # Insert all elements
-                            for element_type, element in reversed(all_elements):
-                                if element_type == 'paragraph':
-                                    new_p = deepcopy(element._element)
-                                    parent.insert(index, new_p)
-                                elif element_type == 'table':
-                                    new_t = deepcopy(element._element)
-                                    parent.insert(index, new_t)
-                            break
-                    
-                    doc.save(output_path)
-                    logger.info("Document saved successfully")
-                    return True
-                else:
-                    return original_replace(template_path, content_path, output_path, placeholder)
-            
-            processor5.replace_placeholder_only = smart_replace_final
-            
-            # Execute Step 5
-            success5 = processor5.process_complete_workflow()
-            if not success5:
-                raise Exception("Failed Step 5: {{cac_buoc_thuc_hien}}")
-            
-            logger.info("✅ Step 5 complete: {{cac_buoc_thuc_hien}}")
-            
-            # Verify final output
-            output_file = self.work_dir / "02_MUC_DO_HIEU_BIET_output.docx"
-            if not output_file.exists():
-                raise Exception("Final output file not generated")
+        # Every path is absolute inside this request's workspace - no os.chdir, so requests can overlap
+        output_path = str(self.work_dir / "02_MUC_DO_HIEU_BIET_output.docx")
+        for p in (processor1, processor2, processor3, processor4):
+            p.pdf_folder = self.pdf_inputs_dir
+        for p in (processor2, processor3, processor4):
+            p.process_folder = self.work_dir / "processed" / p.process_folder.name
+            p.process_folder.mkdir(parents=True, exist_ok=True)
+        
+        # Load the template and locate every placeholder in one scan; each step is handed its paragraph
+        doc = Document(self.work_dir / "02_MUC_DO_HIEU_BIET_template.docx")
+        placeholder_paragraphs = {}
+        for paragraph in doc.paragraphs:
+            for name in _PLACEHOLDERS_RE.findall(paragraph.text):
+                placeholder_paragraphs.setdefault(name, paragraph)
+        
+        # Steps 2-5 only look in body paragraphs, so fail before any OpenAI call if theirs is absent;
+        # {{ten_goi_thau}} may also sit in a table cell - step 1 then runs its own full search
+        missing = [name for name in _PLACEHOLDER_NAMES if name != "ten_goi_thau" and name not in placeholder_paragraphs]
+        if missing:
+            raise Exception(f"Template is missing placeholders: {missing}")
+        
+        # Parse every PDF the steps read in parallel, each exactly once - CHUONG_V yields both its plain
+        # text and the page-marked text step 5 wants; the processors then read from memory, never from disk
+        tbmt_pdf, bmmt_pdf, chuong_v_pdf = (str(self.pdf_inputs_dir / name) for name in _PREFETCH_PDFS)
+        tbmt_text, bmmt_text, (chuong_v_text, chuong_v_pages) = await run_on_pdf_pool([
+            (extract_pdf_text, tbmt_pdf), (extract_pdf_text, bmmt_pdf), (extract_text_and_pages, chuong_v_pdf)
+        ])
+        pdf_texts = {tbmt_pdf: tbmt_text, bmmt_pdf: bmmt_text, chuong_v_pdf: chuong_v_text}
+        for p in (processor1, processor2, processor3, processor4):
+            p.extract_text_from_pdf = lambda pdf_path: pdf_texts[str(pdf_path)]
+        
+        # Step 5 only needs CHUONG_V.pdf and the BUOC files in this workspace
+        processor5.chuong_v_pdf = chuong_v_pdf
+        processor5.buoc_folder = self.work_dir
+        processor5.extract_pdf_text_pymupdf = lambda pdf_path: chuong_v_pages
+        
+        loop = asyncio.get_running_loop()
+        
+        # Steps 1-5: each reads its own PDF and asks OpenAI - independent, so run them concurrently
+        logger.info("Steps 1-5/5: Extracting {{ten_goi_thau}}, {{pham_vi_cung_cap}}, {{can_cu_phap_ly}}, {{muc_dich_cong_viec}}, {{cac_buoc_thuc_hien}} concurrently...")
+        ten_goi_thau, pham_vi_docx, can_cu_docx, muc_dich_docx, buoc_docx = await asyncio.gather(
+            *(loop.run_in_executor(_EXTRACT_POOL, p.extract_content)
+              for p in (processor1, processor2, processor3, processor4, processor5))
+        )
+        for step, (name, result) in enumerate([
+            ("{{ten_goi_thau}}", ten_goi_thau),
+            ("{{pham_vi_cung_cap}}", pham_vi_docx),
+            ("{{can_cu_phap_ly}}", can_cu_docx),
+            ("{{muc_dich_cong_viec}}", muc_dich_docx),
+            ("{{cac_buoc_thuc_hien}}", buoc_docx),
+        ], start=1):
+            if result is None:
+                raise Exception(f"Failed Step {step}: {name}")
+        logger.info("✅ Steps 1-5 extracted")
+        
+        # Step 1 reports an OpenAI failure as the "[KHÔNG TÌM THẤY]" sentinel, not None -
+        # the document still gets built, but must never be served again from the result cache
+        self.cacheable = ten_goi_thau != "[KHÔNG TÌM THẤY]"
+        
+        # Apply all five replacements on the one in-memory document, save once
+        if not processor1.replace_placeholder_in_doc(doc, "{{ten_goi_thau}}", ten_goi_thau,
+                                                     paragraph=placeholder_paragraphs.get("ten_goi_thau")):
+            raise Exception("Failed Step 1: {{ten_goi_thau}}")
+        processor2.replace_placeholder(doc, "{{pham_vi_cung_cap}}", paragraph=placeholder_paragraphs["pham_vi_cung_cap"])
+        processor3.replace_placeholder(doc, "{{can_cu_phap_ly}}", paragraph=placeholder_paragraphs["can_cu_phap_ly"])
+        processor4.replace_placeholder(doc, "{{muc_dich_cong_viec}}", paragraph=placeholder_paragraphs["muc_dich_cong_viec"])
+        logger.info("✅ Steps 1-4 complete: 4 placeholders applied")
+        
+        # Step 5: {{cac_buoc_thuc_hien}} - final accumulation, on the same live document
+        def smart_replace_final(paragraph, content_path):
+            logger.info(f"Smart replace: {content_path} -> live document")
             
-            file_size = output_file.stat().st_size
-            logger.info(f"🎉 Walking skeleton complete! File size: {file_size:,} bytes")
-            return output_file
+            # Content elements parsed once at startup - shared, so each request inserts its own clones
+            all_elements = app.state.buoc_elements[Path(content_path).name]
+            logger.info(f"Found {len(all_elements)} elements to copy")
             
-        finally:
-            os.chdir(original_cwd)
+            # Replace the placeholder paragraph located by the template scan
+            p_element = paragraph._element
+            for element in all_elements:
+                p_element.addprevious(deepcopy(element))
+            p_element.getparent().remove(p_element)
+        
+        smart_replace_final(placeholder_paragraphs["cac_buoc_thuc_hien"], buoc_docx)
+        
+        doc.save(output_path)
+        logger.info("✅ Step 5 complete: {{cac_buoc_thuc_hien}}")
+        
+        # Verify final output - the one stat is reused for the response headers
+        output_file = self.work_dir / "02_MUC_DO_HIEU_BIET_output.docx"
+        try:
+            self.output_stat = output_file.stat()
+        except FileNotFoundError:
+            raise Exception("Final output file not generated")
+        
+        logger.info(f"🎉 Walking skeleton complete! File size: {self.output_stat.st_size:,} bytes")
+        return output_file
+        
     
     def cleanup(self):
         """Clean up workspace"""
-        if self.work_dir and self.work_dir.exists():
-            shutil.rmtree(self.work_dir)
+        if self.workspace:
+            self.workspace.cleanup()
             logger.info("Workspace cleaned up")
 
+@app.on_event("startup")
+async def load_template_blobs():
+    """Read the static template files once - a missing one fails the boot, not a request"""
+    app.state.template_blobs = {}
+    for file_name in _TEMPLATE_FILES:
+        source = Path(file_name)
+        if not source.exists():
+            raise FileNotFoundError(f"Required template not found: {file_name}")
+        app.state.template_blobs[file_name] = source.read_bytes()
+    logger.info(f"Templates cached: {list(app.state.template_blobs)}")
+
+@app.on_event("startup")
+async def load_buoc_elements():
+    """Parse 21_BUOC.docx / 23_BUOC.docx once - step 5 inserts their non-empty paragraphs, then tables"""
+    app.state.buoc_elements = {}
+    for file_name in ("21_BUOC.docx", "23_BUOC.docx"):
+        source_doc = Document(file_name)
+        app.state.buoc_elements[file_name] = (
+            [para._element for para in source_doc.paragraphs if para.text.strip()]
+            + [table._element for table in source_doc.tables]
+        )
+    logger.info(f"Step 5 content cached: {list(app.state.buoc_elements)}")
+
+@app.on_event("startup")
+async def start_pdf_pool():
+    """Start the shared PDF worker pool at boot so the first request does not pay for it"""
+    await run_on_pdf_pool([(os.getpid,)])
+
+@app.on_event("startup")
+async def load_processors():
+    """Construct the 5 processors once - requests work on shallow copies"""
+    app.state.processors = (
+        VietnameseProcurementProcessor(),
+        PhamViCungCapProcessor(),
+        CanCuPhapLyProcessor(),
+        MucDichProcessor(),
+        CombinedProcessor()
+    )
+    logger.info("Processors initialized")
+
 # API Endpoints
 
 @app.get("/")
@@ -293,6 +309,7 @@ async def health_check():
 
 @app.post("/api/process-document")
 async def process_document(
+    background_tasks: BackgroundTasks,
     tbmt_pdf: UploadFile = File(..., description="TBMT.pdf - Thông báo mời thầu"),
     bmmt_pdf: UploadFile = File(..., description="BMMT.pdf - Biểu mẫu mời thầu"),
     chuong_iii_pdf: UploadFile = File(..., description="CHUONG_III.pdf"),
@@ -321,7 +338,7 @@ async def process_document(
         
         # Save uploaded PDFs
         pdf_files = [tbmt_pdf, bmmt_pdf, chuong_iii_pdf, chuong_v_pdf, hsmt_pdf]
-        saved_files = processor.save_uploaded_pdfs(pdf_files)
+        saved_files = await processor.save_uploaded_pdfs(pdf_files)
         logger.info(f"PDFs saved: {list(saved_files.keys())}")
         
         # Validate all required PDFs
@@ -335,26 +352,41 @@ async def process_document(
                 detail=f"Missing required PDF files: {list(missing)}"
             )
         
+        # Same five PDFs as an earlier request -> same DOCX, skip every OpenAI call
+        input_key = processor.input_key()
+        cached_output = _RESULT_CACHE.get(input_key)
+        if cached_output is not None:
+            logger.info(f"Result cache hit: {input_key[:12]}")
+            processor.cleanup()
+            return Response(
+                content=cached_output,
+                media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                headers={"Content-Disposition": "attachment; filename=02_MUC_DO_HIEU_BIET_output.docx"}
+            )
+        
         # Process all placeholders using proven workflow
-        output_file = processor.process_all_placeholders()
+        output_file = await processor.process_all_placeholders()
         logger.info("All placeholders processed successfully")
+        if processor.cacheable:
+            _RESULT_CACHE.set(input_key, output_file.read_bytes())
+        else:
+            logger.warning("OpenAI failure sentinel in the output - not cached")
         
-        # Copy the file to a safe location before cleanup
-        safe_output = Path(tempfile.gettempdir()) / "api_result.docx"
-        shutil.copy2(output_file, safe_output)
-        logger.info(f"File copied to safe location: {safe_output}")
-        
-        # Clean up workspace
-        processor.cleanup()
+        # Clean up workspace only after the response has been sent
+        background_tasks.add_task(processor.cleanup)
         
-        # Return the generated DOCX from safe location
-        return FileResponse(
-            path=safe_output,
+        # Return the generated DOCX straight from the workspace
+        return DocxFileResponse(
+            path=output_file,
             media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
             filename="02_MUC_DO_HIEU_BIET_output.docx",
+            stat_result=processor.output_stat,
             headers={"Content-Disposition": "attachment; filename=02_MUC_DO_HIEU_BIET_output.docx"}
         )
         
+    except HTTPException:
+        processor.cleanup()  # Client errors keep their own status code
+        raise
     except Exception as e:
         logger.error(f"Processing failed: {str(e)}")
         processor.cleanup()  # Clean up on error
@@ -397,8 +429,9 @@ if __name__ == "__main__":
     print("📖 API docs: http://localhost:8000/docs")
     print("✅ Ready for Teams bot integration!")
     
+    # Import string so uvicorn can honour WEB_CONCURRENCY (--workers) - requests no longer share a cwd
     uvicorn.run(
-        app, 
+        "walking_skeleton_api_clean:app", 
         host="0.0.0.0", 
         port=8000,
         log_level="info"